@@ -1,62 +1,114 @@
 import pandas as pd
 import numpy as np
-import matplotlib
-# Use non-interactive backend to prevent Tkinter errors
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
 from io import BytesIO
 import base64
+import sys
+import threading
 
 from data_processor import (
     get_section_id_column, 
     get_pci_column, 
     get_date_columns, 
     get_distress_columns,
-    get_category_columns
+    get_category_columns,
+    get_context_columns,
+    build_section_index,
+    build_maintenance_index,
+    build_pci_pairs
 )
+from metrics import track_stage
 
-def detect_anomalies(current_data, historical_data, maintenance_data):
+# Above this many sections the PCI comparison is drawn as a hexbin density plot
+HEXBIN_THRESHOLD = 5000
+
+# pyplot keeps global figure state, so plots from concurrent request threads must not interleave
+PLOT_LOCK = threading.Lock()
+
+def detect_anomalies(current_data, historical_data, maintenance_data, detectors=None, max_cost=None):
     """
     Detect anomalies in the pavement data using multiple approaches:
     1. Statistical outliers in current data
     2. Unexpected rate of deterioration compared to historical data
     3. Inconsistencies with maintenance history
+    4. PCI inconsistent with deflection, temperature and traffic
     
     Parameters:
     current_data (pandas.DataFrame): Current PMP data
     historical_data (pandas.DataFrame): Historical PMP data
     maintenance_data (pandas.DataFrame): Maintenance history data
+    detectors (list): Names of registered detectors to run, or None for all
+    max_cost (str): Most expensive cost class to run ('fast', 'moderate' or 'slow'), or None for all
     
     Returns:
     list: List of dictionaries containing anomaly information
     """
-    anomalies = []
+    anomalies, _ = run_detectors(current_data, historical_data, maintenance_data, detectors, max_cost)
+    return anomalies
+
+def run_detectors(current_data, historical_data, maintenance_data, detectors=None, max_cost=None, shared=None):
+    """
+    Run the selected registered detectors and time each one
     
-    # Extract section IDs for consistent referencing
-    section_id_col = get_section_id_column(current_data)
+    Detectors whose required column roles are missing are skipped before any work is done.
     
-    # 1. Detect statistical outliers in PCI values
-    anomalies.extend(detect_pci_outliers(current_data, section_id_col))
+    Parameters:
+    current_data (pandas.DataFrame): Current PMP data
+    historical_data (pandas.DataFrame): Historical PMP data
+    maintenance_data (pandas.DataFrame): Maintenance history data
+    detectors (list): Names of registered detectors to run, or None for all
+    max_cost (str): Most expensive cost class to run ('fast', 'moderate' or 'slow'), or None for all
+    shared (dict): Per-analysis intermediate results (see get_pci_pairs), reused by later plots.
+                   May be seeded with a persisted index loader ('load_index', see section_indexes) or with
+                   network-wide 'pci_quartiles' and 'multivariate_model' when the datasets are one shard
+                   of a larger network
     
-    # 2. Check for inconsistent distress types and severities
-    anomalies.extend(detect_distress_inconsistencies(current_data, section_id_col))
+    Returns:
+    tuple: (list of anomaly dictionaries, list of per-detector statistics dictionaries)
+    """
+    anomalies = []
+    stats = []
+    shared = {} if shared is None else shared
     
-    # 3. Compare with historical data to check for unrealistic deterioration rates
-    if not historical_data.empty and section_id_col in historical_data.columns:
-        anomalies.extend(detect_deterioration_anomalies(
-            current_data, historical_data, maintenance_data, section_id_col
-        ))
+    datasets = {
+        'current': current_data,
+        'historical': historical_data,
+        'maintenance': maintenance_data
+    }
     
-    # 4. Check for inconsistencies with maintenance history
-    if not maintenance_data.empty and section_id_col in maintenance_data.columns:
-        anomalies.extend(detect_maintenance_inconsistencies(
-            current_data, maintenance_data, section_id_col
-        ))
+    # Extract section IDs for consistent referencing
+    section_id_col = get_section_id_column(current_data)
     
-    return anomalies
+    for name in select_detectors(detectors, max_cost):
+        detector = DETECTORS[name]
+        missing = find_missing_roles(detector['requires'], datasets, section_id_col)
+        used_datasets = sorted({role.split('.')[0] for role in detector['requires']} | {'current'})
+        
+        detector_stats = {
+            'name': name,
+            'cost': detector['cost'],
+            'status': 'skipped' if missing else 'ran',
+            'missing_roles': missing,
+            'seconds': 0.0,
+            'rows': 0,
+            'anomalies': 0
+        }
+        
+        if not missing:
+            with track_stage(f'detector.{name}') as stage:
+                stage['rows'] = sum(len(datasets[dataset]) for dataset in used_datasets)
+                found = detector['function'](current_data, historical_data, maintenance_data, section_id_col, shared)
+            detector_stats['seconds'] = stage['seconds']
+            detector_stats['rows'] = stage['rows']
+            detector_stats['anomalies'] = len(found)
+            for anomaly in found:
+                anomaly.setdefault('detector', name)
+            anomalies.extend(found)
+        
+        stats.append(detector_stats)
+    
+    return anomalies, stats
 
-def detect_pci_outliers(data, section_id_col, manual_ranges=None):
+def detect_pci_outliers(data, section_id_col, manual_ranges=None, quartiles=None):
     """
     Detect statistical outliers in PCI values and incorporate manual review ranges
     
@@ -64,6 +116,8 @@ def detect_pci_outliers(data, section_id_col, manual_ranges=None):
     data (pandas.DataFrame): Dataset to analyze
     section_id_col (str): Name of section ID column
     manual_ranges (dict): Dictionary of manual PCI ranges {section_id: (min_pci, max_pci)}
+    quartiles (tuple): Precomputed (Q1, Q3) of PCI, e.g. over a whole network when data is one shard of it;
+                       computed from data if None
     
     Returns:
     list: Anomalies related to PCI outliers
@@ -73,8 +127,9 @@ def detect_pci_outliers(data, section_id_col, manual_ranges=None):
     
     if pci_col:
         # Use IQR method to detect outliers
-        Q1 = data[pci_col].quantile(0.25)
-        Q3 = data[pci_col].quantile(0.75)
+        if quartiles is None:
+            quartiles = (data[pci_col].quantile(0.25), data[pci_col].quantile(0.75))
+        Q1, Q3 = quartiles
         IQR = Q3 - Q1
         lower_bound = Q1 - 1.5 * IQR
         upper_bound = Q3 + 1.5 * IQR
@@ -139,7 +194,7 @@ def detect_distress_inconsistencies(data, section_id_col):
     
     return anomalies
 
-def detect_deterioration_anomalies(current_data, historical_data, maintenance_data, section_id_col):
+def detect_deterioration_anomalies(current_data, historical_data, maintenance_data, section_id_col, pci_pairs=None):
     """
     Detect unrealistic deterioration rates
     
@@ -148,73 +203,57 @@ def detect_deterioration_anomalies(current_data, historical_data, maintenance_da
     historical_data (pandas.DataFrame): Historical PMP data 
     maintenance_data (pandas.DataFrame): Maintenance history data
     section_id_col (str): Name of section ID column
+    pci_pairs (pandas.DataFrame): Prebuilt build_pci_pairs result, built here if None
     
     Returns:
     list: Anomalies related to deterioration rates
     """
     anomalies = []
     
-    # Find common sections between current and historical data
-    common_sections = set(current_data[section_id_col]).intersection(set(historical_data[section_id_col]))
-    
     # Get PCI columns
-    pci_col_current = get_pci_column(current_data)
-    pci_col_historical = get_pci_column(historical_data)
-    
-    if not pci_col_current or not pci_col_historical:
+    if not get_pci_column(current_data) or not get_pci_column(historical_data):
         return anomalies
     
     # Get date columns
-    date_cols_current = get_date_columns(current_data)
-    date_cols_historical = get_date_columns(historical_data)
-    
-    if not date_cols_current or not date_cols_historical:
+    if not get_date_columns(current_data) or not get_date_columns(historical_data):
         return anomalies
     
-    for section in common_sections:
-        current_section = current_data[current_data[section_id_col] == section]
-        historical_section = historical_data[historical_data[section_id_col] == section]
-        
-        try:
-            current_date = pd.to_datetime(current_section[date_cols_current[0]].iloc[0])
-            historical_date = pd.to_datetime(historical_section[date_cols_historical[0]].iloc[0])
-            
-            years_diff = (current_date - historical_date).days / 365.25
-            
-            if years_diff > 0:
-                current_pci = current_section[pci_col_current].iloc[0]
-                historical_pci = historical_section[pci_col_historical].iloc[0]
-                
-                pci_change = historical_pci - current_pci
-                annual_deterioration = pci_change / years_diff
-                
-                # Flag if deterioration rate is too high or PCI improved without maintenance
-                if annual_deterioration > 15:  # More than 15 points per year is suspicious
-                    anomalies.append({
-                        'section_id': section,
-                        'reason': f'Excessive deterioration rate: {annual_deterioration:.1f} PCI points/year',
-                        'review_type': 'field',
-                        'confidence': 'high'
-                    })
-                elif annual_deterioration < -5:  # PCI improved by more than 5 points
-                    # Check if maintenance was performed
-                    if not maintenance_data.empty and section_id_col in maintenance_data.columns:
-                        section_maintenance = maintenance_data[maintenance_data[section_id_col] == section]
-                        
-                        if section_maintenance.empty:
-                            anomalies.append({
-                                'section_id': section,
-                                'reason': f'PCI improved by {-annual_deterioration:.1f} points/year without recorded maintenance',
-                                'review_type': 'desktop',
-                                'confidence': 'high'
-                            })
-        except (ValueError, TypeError, IndexError) as e:
-            # Handle date conversion errors
-            print(f"Error processing section {section}: {e}")
+    if pci_pairs is None:
+        pci_pairs = build_pci_pairs(current_data, historical_data, section_id_col)
+    
+    # Sections with unparseable dates get NaN years and are skipped
+    pairs = pci_pairs[pci_pairs['years_between'] > 0]
+    annual_deterioration = (pairs['historical_pci'] - pairs['current_pci']) / pairs['years_between']
+    
+    # Flag if deterioration rate is too high or PCI improved without maintenance
+    excessive = annual_deterioration > 15  # More than 15 points per year is suspicious
+    improved = annual_deterioration < -5  # PCI improved by more than 5 points
+    
+    if not maintenance_data.empty and section_id_col in maintenance_data.columns:
+        # Check if maintenance was performed
+        improved &= ~pairs['section_id'].isin(maintenance_data[section_id_col])
+    else:
+        improved &= False
+    
+    for section, rate in zip(pairs.loc[excessive, 'section_id'].tolist(), annual_deterioration[excessive].tolist()):
+        anomalies.append({
+            'section_id': section,
+            'reason': f'Excessive deterioration rate: {rate:.1f} PCI points/year',
+            'review_type': 'field',
+            'confidence': 'high'
+        })
+    
+    for section, rate in zip(pairs.loc[improved, 'section_id'].tolist(), annual_deterioration[improved].tolist()):
+        anomalies.append({
+            'section_id': section,
+            'reason': f'PCI improved by {-rate:.1f} points/year without recorded maintenance',
+            'review_type': 'desktop',
+            'confidence': 'high'
+        })
     
     return anomalies
 
-def detect_maintenance_inconsistencies(current_data, maintenance_data, section_id_col):
+def detect_maintenance_inconsistencies(current_data, maintenance_data, section_id_col, maintenance_index=None):
     """
     Detect inconsistencies with maintenance history
     
@@ -222,6 +261,7 @@ def detect_maintenance_inconsistencies(current_data, maintenance_data, section_i
     current_data (pandas.DataFrame): Current PMP data
     maintenance_data (pandas.DataFrame): Maintenance history data
     section_id_col (str): Name of section ID column
+    maintenance_index (pandas.DataFrame): Prebuilt build_maintenance_index result, built here if None
     
     Returns:
     list: Anomalies related to maintenance inconsistencies
@@ -246,43 +286,395 @@ def detect_maintenance_inconsistencies(current_data, maintenance_data, section_i
     if not date_cols_current:
         return anomalies
     
-    for idx, row in current_data.iterrows():
-        section = row[section_id_col]
-        section_maintenance = maintenance_data[maintenance_data[section_id_col] == section]
+    if maintenance_index is None:
+        maintenance_index = build_maintenance_index(maintenance_data, section_id_col)
+    
+    # Look up each current row's latest treatment; sections without maintenance get NaT and are skipped
+    latest = maintenance_index.set_index(section_id_col)
+    sections = current_data[section_id_col]
+    latest_date = sections.map(latest['latest_maintenance_date'])
+    maint_type = sections.map(latest['latest_maintenance_type'])
+    current_date = pd.to_datetime(current_data[date_cols_current[0]], format='mixed', errors='coerce')
+    current_pci = pd.to_numeric(current_data[pci_col], errors='coerce')
+    
+    # If maintenance was done within 2 years before data collection
+    recent = (latest_date <= current_date) & ((current_date - latest_date).dt.days / 365.25 <= 2)
+    
+    # Major treatments should result in high PCI
+    major_treatments = ['rehabilitation', 'overlay', 'reconstruction', 'mill and fill']
+    major = maint_type.astype(str).str.lower().str.contains('|'.join(major_treatments), regex=True)
+    
+    flagged = recent & major & (current_pci < 85)
+    
+    for section, treatment, pci in zip(sections[flagged].tolist(), maint_type[flagged].tolist(),
+                                       current_data.loc[flagged, pci_col].tolist()):
+        anomalies.append({
+            'section_id': section,
+            'reason': f'Recent {treatment} but PCI only {pci}. Expected > 85',
+            'review_type': 'field',
+            'confidence': 'high'
+        })
+    
+    return anomalies
+
+def fit_multivariate_model(data, feature_cols, sample_size=50000, support_fraction=0.75,
+                           max_iter=20, random_state=0, min_rows_per_parameter=10):
+    """
+    Fit a robust location/covariance model for PCI and its context columns
+    
+    Uses concentration steps (as in FAST-MCD): starting from a median-based estimate,
+    the covariance is repeatedly refit on the fraction of rows with the smallest
+    Mahalanobis distances, so contaminated sections do not distort the fit.
+    
+    Parameters:
+    data (pandas.DataFrame): Dataset to fit on
+    feature_cols (list): Feature column names, with the PCI column last
+    sample_size (int): Maximum number of rows to fit on; larger datasets are sampled
+    support_fraction (float): Fraction of rows kept in each concentration step
+    max_iter (int): Maximum number of concentration steps
+    random_state (int): Seed used when sampling rows
+    min_rows_per_parameter (int): Complete rows required per feature (plus one); below
+                                  10 * (p + 1) the robust covariance is too unstable to flag on
+    
+    Returns:
+    dict or None: Fitted model, or None if there are too few complete rows
+    """
+    complete = data[feature_cols].apply(pd.to_numeric, errors='coerce').dropna()
+    
+    n_features = len(feature_cols)
+    if len(complete) < min_rows_per_parameter * (n_features + 1):
+        return None
+    
+    if sample_size and len(complete) > sample_size:
+        complete = complete.sample(n=sample_size, random_state=random_state)
+    
+    X = complete.to_numpy(dtype=float)
+    
+    # Standardize with robust scale so traffic volumes don't swamp deflection
+    center = np.median(X, axis=0)
+    scale = np.median(np.abs(X - center), axis=0) * 1.4826
+    scale[scale == 0] = X.std(axis=0)[scale == 0]
+    scale[scale == 0] = 1.0
+    Z = (X - center) / scale
+    
+    h = max(int(len(Z) * support_fraction), n_features + 1)
+    location = np.zeros(n_features)
+    covariance = np.cov(Z, rowvar=False)
+    subset = None
+    
+    for _ in range(max_iter):
+        precision = np.linalg.pinv(covariance)
+        diff = Z - location
+        d2 = np.einsum('ij,jk,ik->i', diff, precision, diff)
+        new_subset = np.argpartition(d2, h - 1)[:h]
+        new_subset.sort()
         
-        if section_maintenance.empty:
-            continue
+        if subset is not None and np.array_equal(subset, new_subset):
+            break
         
-        try:
-            current_pci = row[pci_col]
-            current_date = pd.to_datetime(row[date_cols_current[0]])
-            latest_maintenance_date = pd.to_datetime(section_maintenance[maint_date_cols[0]]).max()
-            
-            # If maintenance was done within 2 years before data collection
-            if latest_maintenance_date <= current_date and (current_date - latest_maintenance_date).days / 365.25 <= 2:
-                maint_type_cols = [col for col in maintenance_data.columns if 'type' in col.lower() or 'work' in col.lower()]
-                
-                if maint_type_cols:
-                    # Get type of latest maintenance
-                    latest_maint_idx = section_maintenance[maint_date_cols[0]].idxmax()
-                    maint_type = section_maintenance.loc[latest_maint_idx, maint_type_cols[0]]
-                    
-                    # Major treatments should result in high PCI
-                    major_treatments = ['rehabilitation', 'overlay', 'reconstruction', 'mill and fill']
-                    if any(treatment in str(maint_type).lower() for treatment in major_treatments) and current_pci < 85:
-                        anomalies.append({
-                            'section_id': section,
-                            'reason': f'Recent {maint_type} but PCI only {current_pci}. Expected > 85',
-                            'review_type': 'field',
-                            'confidence': 'high'
-                        })
-        except (ValueError, TypeError, IndexError) as e:
-            # Handle date conversion errors
-            print(f"Error processing maintenance for section {section}: {e}")
+        subset = new_subset
+        location = Z[subset].mean(axis=0)
+        covariance = np.cov(Z[subset], rowvar=False)
+    
+    # Rescale the h-subset covariance so it is consistent for the full population
+    precision = np.linalg.pinv(covariance)
+    diff = Z - location
+    d2 = np.einsum('ij,jk,ik->i', diff, precision, diff)
+    chi2_median = n_features * (1 - 2 / (9 * n_features)) ** 3
+    covariance = covariance * (np.median(d2) / chi2_median)
+    
+    return {
+        'columns': list(feature_cols),
+        'center': center,
+        'scale': scale,
+        'location': location,
+        'covariance': covariance,
+        'precision': np.linalg.pinv(covariance),
+        'n_fit': len(Z)
+    }
+
+def score_multivariate(data, model, chunk_size=100000):
+    """
+    Score PCI against the value expected from its context columns
+    
+    The expected PCI is the conditional mean of PCI given the context columns under
+    the fitted model; the score is the residual in conditional standard deviations.
+    
+    Parameters:
+    data (pandas.DataFrame): Dataset to score
+    model (dict): Model returned by fit_multivariate_model
+    chunk_size (int): Number of rows scored at a time
+    
+    Returns:
+    tuple: (expected PCI, standardized residual) as numpy arrays, NaN where inputs are missing
+    """
+    feature_cols = model['columns']
+    center, scale = model['center'], model['scale']
+    location, precision = model['location'], model['precision']
+    
+    # For PCI (last feature) given the context: E[pci] = mu_p - (P_pc . (x_c - mu_c)) / P_pp
+    p_pp = precision[-1, -1]
+    p_pc = precision[-1, :-1]
+    conditional_sd = 1 / np.sqrt(p_pp)
+    
+    n_rows = len(data)
+    expected = np.full(n_rows, np.nan)
+    residual_z = np.full(n_rows, np.nan)
+    
+    for start in range(0, n_rows, chunk_size):
+        chunk = data[feature_cols].iloc[start:start + chunk_size]
+        Z = (chunk.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float) - center) / scale
+        
+        context = Z[:, :-1] - location[:-1]
+        expected_z = location[-1] - context @ p_pc / p_pp
+        
+        expected[start:start + len(Z)] = expected_z * scale[-1] + center[-1]
+        residual_z[start:start + len(Z)] = (Z[:, -1] - expected_z) / conditional_sd
+    
+    return expected, residual_z
+
+def detect_multivariate_outliers(data, section_id_col, z_threshold=3.0, high_z_threshold=4.5,
+                                 sample_size=50000, chunk_size=100000, model=None):
+    """
+    Detect sections whose PCI doesn't fit their deflection, temperature and traffic context
+    
+    Parameters:
+    data (pandas.DataFrame): Dataset to analyze
+    section_id_col (str): Name of section ID column
+    z_threshold (float): Standardized residual above which a section is flagged
+    high_z_threshold (float): Standardized residual above which confidence is high
+    sample_size (int): Maximum number of rows used to fit the model
+    chunk_size (int): Number of rows scored at a time
+    model (dict): Model already fitted by fit_multivariate_model, e.g. on a sample of a whole
+                  network when data is one shard of it; fitted on data if None
+    
+    Returns:
+    list: Anomalies related to PCI inconsistent with its context
+    """
+    anomalies = []
+    pci_col = get_pci_column(data)
+    context_cols = get_context_columns(data)
+    
+    if not pci_col or not context_cols:
+        return anomalies
+    
+    if model is None:
+        model = fit_multivariate_model(data, context_cols + [pci_col], sample_size=sample_size)
+    if model is None:
+        return anomalies
+    
+    expected, residual_z = score_multivariate(data, model, chunk_size=chunk_size)
+    
+    flagged = np.flatnonzero(np.abs(np.nan_to_num(residual_z)) > z_threshold)
+    section_ids = data[section_id_col].tolist()
+    pci_values = data[pci_col].tolist()
+    context_names = ', '.join(context_cols)
+    
+    for i in flagged:
+        anomalies.append({
+            'section_id': section_ids[i],
+            'reason': f'PCI value ({pci_values[i]}) does not fit {context_names}: expected about {expected[i]:.1f} ({residual_z[i]:+.1f} SD)',
+            'review_type': 'desktop',
+            'confidence': 'high' if abs(residual_z[i]) > high_z_threshold else 'medium'
+        })
     
     return anomalies
 
-def generate_visualizations(current_data, historical_data, anomalies):
+# Registry of detectors run by detect_anomalies. Each entry declares the column
+# roles it needs as '<dataset>.<role>' and a cost class used for opt-in selection.
+COST_CLASSES = ['fast', 'moderate', 'slow']
+
+ROLE_FINDERS = {
+    'section_id': lambda data, section_id_col: section_id_col in data.columns,
+    'pci': lambda data, section_id_col: get_pci_column(data),
+    'date': lambda data, section_id_col: get_date_columns(data),
+    'distress': lambda data, section_id_col: get_distress_columns(data),
+    'context': lambda data, section_id_col: get_context_columns(data)
+}
+
+DETECTORS = {}
+
+def register_detector(name, function, requires, cost='moderate'):
+    """
+    Register a detector so detect_anomalies can select and run it
+    
+    Parameters:
+    name (str): Unique detector name used in requests
+    function (callable): Called as function(current_data, historical_data, maintenance_data, section_id_col, shared)
+                         and returning a list of anomaly dictionaries; shared holds per-analysis results
+    requires (list): Required column roles such as 'current.pci' or 'historical.date'
+    cost (str): Cost class, one of COST_CLASSES
+    """
+    if cost not in COST_CLASSES:
+        raise ValueError(f"Unknown cost class '{cost}'. Expected one of {COST_CLASSES}")
+    
+    for role in requires:
+        dataset, _, role_name = role.partition('.')
+        if dataset not in ('current', 'historical', 'maintenance') or role_name not in ROLE_FINDERS:
+            raise ValueError(f"Unknown column role '{role}' for detector '{name}'")
+    
+    DETECTORS[name] = {
+        'function': function,
+        'requires': list(requires),
+        'cost': cost
+    }
+
+def select_detectors(detectors=None, max_cost=None):
+    """
+    Resolve which registered detectors to run
+    
+    Parameters:
+    detectors (list): Detector names, or None for all registered detectors
+    max_cost (str): Most expensive cost class to include, or None for all
+    
+    Returns:
+    list: Detector names in registration order
+    """
+    if detectors is None:
+        selected = list(DETECTORS)
+    else:
+        if not isinstance(detectors, (list, tuple)) or not all(isinstance(name, str) for name in detectors):
+            raise ValueError(f'detectors must be a list of detector names, got {detectors!r}')
+        unknown = [name for name in detectors if name not in DETECTORS]
+        if unknown:
+            raise ValueError(f"Unknown detectors: {', '.join(unknown)}")
+        selected = [name for name in DETECTORS if name in detectors]
+    
+    if max_cost is not None:
+        if max_cost not in COST_CLASSES:
+            raise ValueError(f"Unknown cost class '{max_cost}'. Expected one of {COST_CLASSES}")
+        max_rank = COST_CLASSES.index(max_cost)
+        selected = [name for name in selected if COST_CLASSES.index(DETECTORS[name]['cost']) <= max_rank]
+    
+    return selected
+
+def find_missing_roles(requires, datasets, section_id_col):
+    """
+    Check which required column roles are missing from the datasets
+    
+    Parameters:
+    requires (list): Required column roles such as 'current.pci'
+    datasets (dict): Datasets keyed by 'current', 'historical' and 'maintenance'
+    section_id_col (str): Name of section ID column
+    
+    Returns:
+    list: Required roles that could not be found
+    """
+    missing = []
+    for role in requires:
+        dataset, _, role_name = role.partition('.')
+        data = datasets[dataset]
+        if data.empty or not ROLE_FINDERS[role_name](data, section_id_col):
+            missing.append(role)
+    return missing
+
+def get_historical_index(shared, historical_data, section_id_col):
+    """
+    Get the per-section historical PCI/date index, building it once per analysis
+    
+    Uses shared['load_index'] when present so a persisted index is reused (see section_indexes).
+    
+    Parameters:
+    shared (dict): Per-analysis intermediate results
+    historical_data (pandas.DataFrame): Historical PMP data
+    section_id_col (str): Name of section ID column
+    
+    Returns:
+    pandas.DataFrame: build_section_index(historical_data, section_id_col, 'historical') result
+    """
+    if 'historical_index' not in shared:
+        load_index = shared.get('load_index')
+        shared['historical_index'] = (
+            load_index('historical', historical_data, section_id_col) if load_index
+            else build_section_index(historical_data, section_id_col, 'historical')
+        )
+    return shared['historical_index']
+
+def get_maintenance_index(shared, maintenance_data, section_id_col):
+    """
+    Get each section's latest maintenance treatment, building it once per analysis
+    
+    Uses shared['load_index'] when present so a persisted index is reused (see section_indexes).
+    
+    Parameters:
+    shared (dict): Per-analysis intermediate results
+    maintenance_data (pandas.DataFrame): Maintenance history data
+    section_id_col (str): Name of section ID column
+    
+    Returns:
+    pandas.DataFrame: build_maintenance_index result
+    """
+    if 'maintenance_index' not in shared:
+        load_index = shared.get('load_index')
+        shared['maintenance_index'] = (
+            load_index('maintenance', maintenance_data, section_id_col) if load_index
+            else build_maintenance_index(maintenance_data, section_id_col)
+        )
+    return shared['maintenance_index']
+
+def get_pci_pairs(shared, current_data, historical_data, section_id_col):
+    """
+    Get the paired current/historical PCI table, building it once per analysis
+    
+    Parameters:
+    shared (dict): Per-analysis intermediate results
+    current_data (pandas.DataFrame): Current PMP data
+    historical_data (pandas.DataFrame): Historical PMP data
+    section_id_col (str): Name of section ID column
+    
+    Returns:
+    pandas.DataFrame: build_pci_pairs result
+    """
+    if 'pci_pairs' not in shared:
+        shared['pci_pairs'] = build_pci_pairs(
+            current_data, historical_data, section_id_col,
+            get_historical_index(shared, historical_data, section_id_col)
+        )
+    return shared['pci_pairs']
+
+register_detector(
+    'pci_outliers',
+    lambda current, historical, maintenance, section_id_col, shared: detect_pci_outliers(
+        current, section_id_col, quartiles=shared.get('pci_quartiles')
+    ),
+    requires=['current.section_id', 'current.pci'],
+    cost='fast'
+)
+register_detector(
+    'distress_inconsistencies',
+    lambda current, historical, maintenance, section_id_col, shared: detect_distress_inconsistencies(current, section_id_col),
+    requires=['current.section_id', 'current.distress'],
+    cost='slow'
+)
+register_detector(
+    'deterioration',
+    lambda current, historical, maintenance, section_id_col, shared: detect_deterioration_anomalies(
+        current, historical, maintenance, section_id_col,
+        get_pci_pairs(shared, current, historical, section_id_col)
+    ),
+    requires=['current.section_id', 'current.pci', 'current.date',
+              'historical.section_id', 'historical.pci', 'historical.date'],
+    cost='fast'
+)
+register_detector(
+    'maintenance_inconsistencies',
+    lambda current, historical, maintenance, section_id_col, shared: detect_maintenance_inconsistencies(
+        current, maintenance, section_id_col, get_maintenance_index(shared, maintenance, section_id_col)
+    ),
+    requires=['current.section_id', 'current.pci', 'current.date',
+              'maintenance.section_id', 'maintenance.date'],
+    cost='fast'
+)
+register_detector(
+    'multivariate',
+    lambda current, historical, maintenance, section_id_col, shared: detect_multivariate_outliers(
+        current, section_id_col, model=shared.get('multivariate_model')
+    ),
+    requires=['current.section_id', 'current.pci', 'current.context'],
+    cost='moderate'
+)
+
+def generate_visualizations(current_data, historical_data, anomalies, shared=None):
     """
     Generate visualization plots for the data and anomalies
     
@@ -290,36 +682,42 @@ def generate_visualizations(current_data, historical_data, anomalies):
     current_data (pandas.DataFrame): Current PMP data
     historical_data (pandas.DataFrame): Historical PMP data
     anomalies (list): List of detected anomalies
+    shared (dict): Per-analysis intermediate results from run_detectors
     
     Returns:
     dict: Dictionary of base64-encoded plot images
     """
-    plots = {}
-    
-    try:
-        # 1. PCI Distribution
-        pci_distribution_plot = generate_pci_distribution(current_data)
-        if pci_distribution_plot:
-            plots['pci_distribution'] = pci_distribution_plot
+    with track_stage('generate_visualizations') as stage:
+        stage['rows'] = len(current_data)
+        plots = {}
+    
+        with PLOT_LOCK:
+            try:
+                # 1. PCI Distribution
+                pci_distribution_plot = generate_pci_distribution(current_data)
+                if pci_distribution_plot:
+                    plots['pci_distribution'] = pci_distribution_plot
         
-        # 2. PCI by road category
-        pci_by_category_plot = generate_pci_by_category(current_data)
-        if pci_by_category_plot:
-            plots['pci_by_category'] = pci_by_category_plot
+                # 2. PCI by road category
+                pci_by_category_plot = generate_pci_by_category(current_data)
+                if pci_by_category_plot:
+                    plots['pci_by_category'] = pci_by_category_plot
         
-        # 3. Comparison of current vs historical PCI
-        if not historical_data.empty:
-            pci_comparison_plot = generate_pci_comparison(current_data, historical_data)
-            if pci_comparison_plot:
-                plots['pci_comparison'] = pci_comparison_plot
+                # 3. Comparison of current vs historical PCI
+                if not historical_data.empty:
+                    pci_comparison_plot = generate_pci_comparison(
+                        current_data, historical_data, (shared or {}).get('pci_pairs')
+                    )
+                    if pci_comparison_plot:
+                        plots['pci_comparison'] = pci_comparison_plot
         
-        # 4. Map of anomalies if geo data is available
-        anomaly_map_plot = generate_anomaly_map(current_data, anomalies)
-        if anomaly_map_plot:
-            plots['anomaly_map'] = anomaly_map_plot
+                # 4. Map of anomalies if geo data is available
+                anomaly_map_plot = generate_anomaly_map(current_data, anomalies)
+                if anomaly_map_plot:
+                    plots['anomaly_map'] = anomaly_map_plot
     
-    except Exception as e:
-        print(f"Error generating visualizations: {e}")
+            except Exception as e:
+                print(f"Error generating visualizations: {e}")
     
     return plots
 
@@ -338,6 +736,7 @@ def generate_pci_distribution(data):
     if not pci_col:
         return None
     
+    plt, sns = get_plotting_modules()
     plt.figure(figsize=(10, 6))
     sns.histplot(data[pci_col], kde=True)
     plt.title('Distribution of PCI Values')
@@ -362,6 +761,7 @@ def generate_pci_by_category(data):
     if not pci_col or not category_cols:
         return None
     
+    plt, sns = get_plotting_modules()
     plt.figure(figsize=(12, 6))
     sns.boxplot(x=category_cols[0], y=pci_col, data=data)
     plt.title('PCI by Road Category')
@@ -369,13 +769,14 @@ def generate_pci_by_category(data):
     
     return save_plot_to_base64()
 
-def generate_pci_comparison(current_data, historical_data):
+def generate_pci_comparison(current_data, historical_data, pci_pairs=None):
     """
     Generate comparison of current vs historical PCI
     
     Parameters:
     current_data (pandas.DataFrame): Current PMP data
     historical_data (pandas.DataFrame): Historical PMP data
+    pci_pairs (pandas.DataFrame): Prebuilt build_pci_pairs result, built here if None
     
     Returns:
     str or None: Base64-encoded image or None if visualization failed
@@ -390,34 +791,23 @@ def generate_pci_comparison(current_data, historical_data):
     if not pci_col_current or not pci_col_historical or section_id_col not in historical_data.columns:
         return None
     
-    # Find common sections
-    common_sections = set(current_data[section_id_col]).intersection(set(historical_data[section_id_col]))
-    
-    if not common_sections:
-        return None
+    if pci_pairs is None:
+        pci_pairs = build_pci_pairs(current_data, historical_data, section_id_col)
     
-    comparison_data = []
+    comparison_df = pci_pairs.dropna(subset=['current_pci', 'historical_pci'])
     
-    for section in common_sections:
-        try:
-            current_pci = current_data[current_data[section_id_col] == section][pci_col_current].iloc[0]
-            historical_pci = historical_data[historical_data[section_id_col] == section][pci_col_historical].iloc[0]
-            
-            comparison_data.append({
-                'section_id': section,
-                'current_pci': current_pci,
-                'historical_pci': historical_pci
-            })
-        except (IndexError, KeyError) as e:
-            print(f"Error processing comparison for section {section}: {e}")
-    
-    if not comparison_data:
+    if comparison_df.empty:
         return None
     
-    comparison_df = pd.DataFrame(comparison_data)
-    
+    plt, _ = get_plotting_modules()
     plt.figure(figsize=(10, 10))
-    plt.scatter(comparison_df['historical_pci'], comparison_df['current_pci'], alpha=0.6)
+    
+    if len(comparison_df) > HEXBIN_THRESHOLD:
+        # Bin large networks so render time doesn't grow with the number of sections
+        plt.hexbin(comparison_df['historical_pci'], comparison_df['current_pci'], gridsize=50, mincnt=1, bins='log')
+        plt.colorbar(label='Sections')
+    else:
+        plt.scatter(comparison_df['historical_pci'], comparison_df['current_pci'], alpha=0.6)
     
     # Add reference line for no change
     min_val = min(comparison_df['historical_pci'].min(), comparison_df['current_pci'].min())
@@ -452,6 +842,7 @@ def generate_anomaly_map(data, anomalies):
     data_copy = data.copy()
     data_copy['is_anomaly'] = data_copy[section_id_col].isin(anomaly_sections)
     
+    plt, sns = get_plotting_modules()
     plt.figure(figsize=(12, 8))
     sns.scatterplot(
         x='longitude', 
@@ -466,6 +857,25 @@ def generate_anomaly_map(data, anomalies):
     
     return save_plot_to_base64()
 
+def get_plotting_modules():
+    """
+    Import matplotlib and seaborn on first use
+    
+    They are the slowest imports in the app, so workers only pay for them once a plot is requested.
+    
+    Returns:
+    tuple: (matplotlib.pyplot, seaborn) modules
+    """
+    if 'seaborn' not in sys.modules:
+        with track_stage('import_plotting'):
+            import matplotlib
+            # Use non-interactive backend to prevent Tkinter errors
+            matplotlib.use('Agg')
+            import matplotlib.pyplot
+            import seaborn
+    
+    return sys.modules['matplotlib.pyplot'], sys.modules['seaborn']
+
 def save_plot_to_base64():
     """
     Save current matplotlib plot to a base64 string
@@ -473,6 +883,7 @@ def save_plot_to_base64():
     Returns:
     str: Base64-encoded image
     """
+    plt, _ = get_plotting_modules()
     try:
         buffer = BytesIO()
         plt.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
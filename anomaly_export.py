@@ -0,0 +1,296 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from data_processor import get_section_id_column, get_pci_column
+from metrics import track_stage
+
+ANOMALIES_FILE = 'anomalies.csv'
+ANOMALY_COLUMNS = ['section_id', 'detector', 'confidence', 'review_type', 'reason']
+EXPORT_FORMATS = {
+    'csv': {'mimetype': 'text/csv', 'extension': 'csv'},
+    'xlsx': {'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'extension': 'xlsx'},
+    'parquet': {'mimetype': 'application/vnd.apache.parquet', 'extension': 'parquet'}
+}
+
+def save_anomalies(session_folder, anomalies):
+    """
+    Store an analysis' anomalies in its session folder for later export
+
+    Parameters:
+    session_folder (str): Session folder
+    anomalies (list): Anomaly dictionaries from run_detectors
+    """
+    anomaly_df = pd.DataFrame(anomalies).reindex(columns=ANOMALY_COLUMNS)
+    temp_path = os.path.join(session_folder, f'{ANOMALIES_FILE}.tmp')
+    anomaly_df.to_csv(temp_path, index=False)
+    os.replace(temp_path, os.path.join(session_folder, ANOMALIES_FILE))
+
+def load_anomalies(session_folder):
+    """
+    Load the anomalies stored for a session
+
+    Parameters:
+    session_folder (str): Session folder
+
+    Returns:
+    pandas.DataFrame: Stored anomalies
+    """
+    anomalies_path = os.path.join(session_folder, ANOMALIES_FILE)
+    if not os.path.exists(anomalies_path):
+        raise KeyError('No analysis results stored for this session. Run an analysis first.')
+    return pd.read_csv(anomalies_path)
+
+def filter_anomalies(anomaly_df, confidence=None, review_type=None, search=None):
+    """
+    Apply the anomaly list filters that don't need section attributes
+
+    Parameters:
+    anomaly_df (pandas.DataFrame): Stored anomalies
+    confidence (list): Confidence levels to keep, or None for all; an empty list keeps nothing, like the UI
+    review_type (list): Review types to keep, or None for all; an empty list keeps nothing
+    search (str): Case-insensitive text the section ID, reason, confidence or review type must contain
+
+    Returns:
+    pandas.DataFrame: Matching anomalies
+    """
+    mask = pd.Series(True, index=anomaly_df.index)
+
+    if confidence is not None:
+        mask &= anomaly_df['confidence'].isin(confidence)
+    if review_type is not None:
+        mask &= anomaly_df['review_type'].isin(review_type)
+    if search:
+        text = (anomaly_df['section_id'].astype(str) + ' ' + anomaly_df['reason'].astype(str) + ' ' +
+                anomaly_df['confidence'].astype(str) + ' ' + anomaly_df['review_type'].astype(str))
+        mask &= text.str.lower().str.contains(search.lower(), regex=False)
+
+    return anomaly_df[mask]
+
+def get_export_columns(anomaly_df, current_data):
+    """
+    Get the export's columns: the anomaly fields, then the section's current attributes
+
+    Parameters:
+    anomaly_df (pandas.DataFrame): Stored anomalies
+    current_data (pandas.DataFrame): Current PMP data
+
+    Returns:
+    list: Column names
+    """
+    section_id_col = get_section_id_column(current_data)
+    return list(anomaly_df.columns) + [
+        col for col in current_data.columns if col != section_id_col and col not in anomaly_df.columns
+    ]
+
+def iter_export_chunks(anomaly_df, current_data, min_pci=None, max_pci=None, pci_ranges=None, chunk_size=50000):
+    """
+    Join anomalies with their section attributes chunk by chunk, applying PCI filters
+
+    Parameters:
+    anomaly_df (pandas.DataFrame): Filtered anomalies
+    current_data (pandas.DataFrame): Current PMP data
+    min_pci (float): Lowest section PCI to keep; sections without PCI always pass
+    max_pci (float): Highest section PCI to keep; sections without PCI always pass
+    pci_ranges (list): (start, end) PCI ranges; if given, a section's PCI must fall in one of them
+    chunk_size (int): Anomalies joined per chunk
+
+    Yields:
+    pandas.DataFrame: Joined rows
+    """
+    section_id_col = get_section_id_column(current_data)
+    pci_col = get_pci_column(current_data)
+
+    # One row of attributes per section so the join can't multiply anomalies
+    attributes = current_data.drop_duplicates(subset=section_id_col, keep='first').set_index(section_id_col)
+    attributes = attributes[get_export_columns(anomaly_df, current_data)[len(anomaly_df.columns):]]
+
+    # Stored section IDs are re-read from CSV, so align them with the current data's type
+    section_ids = anomaly_df['section_id']
+    try:
+        section_ids = section_ids.astype(attributes.index.dtype)
+    except (ValueError, TypeError):
+        pass
+
+    for start in range(0, len(anomaly_df), chunk_size):
+        chunk = anomaly_df.iloc[start:start + chunk_size]
+        joined = chunk.reset_index(drop=True).join(
+            attributes.reindex(section_ids.iloc[start:start + chunk_size]).reset_index(drop=True)
+        )
+
+        if pci_col:
+            pci = pd.to_numeric(joined[pci_col], errors='coerce')
+            mask = pd.Series(True, index=joined.index)
+            if min_pci is not None:
+                mask &= pci.isna() | (pci >= min_pci)
+            if max_pci is not None:
+                mask &= pci.isna() | (pci <= max_pci)
+            if pci_ranges:
+                in_range = pd.Series(False, index=joined.index)
+                for range_start, range_end in pci_ranges:
+                    in_range |= (pci >= range_start) & (pci <= range_end)
+                mask &= in_range
+            joined = joined[mask]
+
+        if not joined.empty:
+            yield joined
+
+def stream_csv(chunks, columns):
+    """
+    Render joined chunks as CSV text, one chunk at a time
+
+    Parameters:
+    chunks (iterable): DataFrames from iter_export_chunks
+    columns (list): Output columns, written as the header even if nothing matches
+
+    Yields:
+    str: CSV text
+    """
+    with track_stage('serialize.anomaly_export') as stage:
+        yield pd.DataFrame(columns=columns).to_csv(index=False)
+        for chunk in chunks:
+            stage['rows'] += len(chunk)
+            yield chunk.to_csv(index=False, header=False)
+
+def write_xlsx(path, chunks, columns):
+    """
+    Write joined chunks to an .xlsx file in openpyxl's constant-memory write-only mode
+
+    Parameters:
+    path (str): Output file path
+    chunks (iterable): DataFrames from iter_export_chunks
+    columns (list): Output columns
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Anomalies')
+    worksheet.append(columns)
+
+    with track_stage('serialize.anomaly_export') as stage:
+        for chunk in chunks:
+            stage['rows'] += len(chunk)
+            # NaN isn't valid in a cell, so write empty cells instead
+            for row in chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None):
+                worksheet.append(row)
+        workbook.save(path)
+
+def write_parquet(path, chunks, columns):
+    """
+    Write joined chunks to a Parquet file one row group at a time
+
+    Parameters:
+    path (str): Output file path
+    chunks (iterable): DataFrames from iter_export_chunks
+    columns (list): Output columns
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    schema = None
+    with track_stage('serialize.anomaly_export') as stage:
+        try:
+            for chunk in chunks:
+                stage['rows'] += len(chunk)
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    schema = table.schema
+                    writer = pq.ParquetWriter(path, schema)
+                writer.write_table(table.cast(schema))
+
+            if writer is None:
+                # Nothing matched; still produce a valid file with the expected columns
+                empty = pd.DataFrame({col: pd.Series(dtype=object) for col in columns})
+                pq.write_table(pa.Table.from_pandas(empty, preserve_index=False), path)
+        finally:
+            if writer is not None:
+                writer.close()
+
+def export_to_temp_file(export_format, chunks, columns):
+    """
+    Write an Excel or Parquet export to a temporary file
+
+    Parameters:
+    export_format (str): 'xlsx' or 'parquet'
+    chunks (iterable): DataFrames from iter_export_chunks
+    columns (list): Output columns
+
+    Returns:
+    str: Temporary file path; the caller removes it once sent
+    """
+    handle, path = tempfile.mkstemp(suffix=f'.{EXPORT_FORMATS[export_format]["extension"]}')
+    os.close(handle)
+
+    try:
+        if export_format == 'xlsx':
+            write_xlsx(path, chunks, columns)
+        else:
+            write_parquet(path, chunks, columns)
+    except Exception:
+        os.remove(path)
+        raise
+
+    return path
+
+def stream_file(path, block_size=1024 * 1024):
+    """
+    Stream a temporary file in blocks and delete it afterwards
+
+    Parameters:
+    path (str): File path
+    block_size (int): Bytes per block
+
+    Yields:
+    bytes: File contents
+    """
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                yield block
+    finally:
+        os.remove(path)
+
+def parse_pci_ranges(value):
+    """
+    Parse manual PCI ranges in the UI's "0-10,20-30" format
+
+    Parameters:
+    value (str): Comma-separated ranges
+
+    Returns:
+    list: (start, end) tuples
+    """
+    ranges = []
+    for part in filter(None, (value or '').split(',')):
+        start, end = (float(bound) for bound in part.split('-'))
+        if np.isnan(start) or np.isnan(end) or start > end:
+            raise ValueError(f"Invalid PCI range '{part}'")
+        ranges.append((start, end))
+    return ranges
+
+def parse_pci_bound(value, name):
+    """
+    Parse an optional PCI filter bound such as min_pci
+
+    Parameters:
+    value (str): Query string value, or None if absent
+    name (str): Parameter name, used in the error message
+
+    Returns:
+    float: The bound, or None if absent or empty
+    """
+    if value is None or not value.strip():
+        return None
+    try:
+        bound = float(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} '{value}'. Expected a number")
+    if not np.isfinite(bound):
+        raise ValueError(f"Invalid {name} '{value}'. Expected a number")
+    return bound
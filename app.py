@@ -1,20 +1,28 @@
-from flask import Flask, request, jsonify, send_file, send_from_directory, Response
+from flask import Flask, request, jsonify, send_file, send_from_directory, Response, g
 import os
-import numpy as np
 import datetime
 import tempfile
-import pandas as pd
 import io
 import csv
 
 # Import from our modules
-from data_processor import load_datasets, get_section_id_column, get_pci_column, get_date_columns
-from anomaly_detector import detect_anomalies, generate_visualizations
+from data_processor import load_datasets, create_minitab_dataset
+from anomaly_detector import run_detectors, generate_visualizations
+from sessions import DATA_TYPES, create_session, add_session_files, load_session, get_session_folder
+from section_indexes import make_index_loader, remove_idle_indexes
+from metrics import track_stage, start_profile, finish_profile, get_profile, render_prometheus
+from anomaly_export import (EXPORT_FORMATS, save_anomalies, load_anomalies, filter_anomalies, get_export_columns,
+                            iter_export_chunks, stream_csv, export_to_temp_file, stream_file, parse_pci_ranges,
+                            parse_pci_bound)
 
 # Configure the app with explicit static path
 app = Flask(__name__, static_folder='static', static_url_path='/static')
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max upload
+app.config['SESSION_CACHE_SIZE'] = 8  # Sessions whose loaded datasets are kept in memory
+app.config['SESSION_TTL_SECONDS'] = 30 * 60  # Evict cached datasets and delete session folders unused for this long
+app.config['INDEX_FOLDER'] = os.path.join('uploads', 'indexes')  # Historical/maintenance indexes keyed by file hash
+app.config['INDEX_TTL_SECONDS'] = 7 * 24 * 60 * 60  # Delete persisted indexes unused for this long
 
 # Create necessary directories
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -25,6 +33,35 @@ ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@app.before_request
+def start_request_profile():
+    # ?profile=1 returns a per-stage breakdown for this request
+    g.profiling = request.args.get('profile') == '1'
+    if g.profiling:
+        start_profile()
+
+@app.after_request
+def add_profile_header(response):
+    if g.get('profiling'):
+        g.profiling = False
+        stages = finish_profile()
+        response.headers['Server-Timing'] = ', '.join(
+            f"{stage['name']};dur={stage['seconds'] * 1000:.1f}" for stage in stages if 'seconds' in stage
+        )
+    return response
+
+@app.teardown_request
+def stop_request_profile(error=None):
+    # after_request is skipped on unhandled errors, so make sure tracing is stopped
+    if g.get('profiling'):
+        g.profiling = False
+        finish_profile()
+
+@app.route('/metrics')
+def metrics():
+    """Expose pipeline stage timings and cache counters in Prometheus text format"""
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     return send_from_directory('static', 'index.html')
@@ -33,6 +70,16 @@ def index():
 def serve_static(path):
     return send_from_directory('static', path)
 
+def start_session():
+    """Create a session, first clearing out idle sessions and persisted indexes"""
+    remove_idle_indexes(app.config['INDEX_FOLDER'], app.config['INDEX_TTL_SECONDS'])
+    return create_session(app.config['UPLOAD_FOLDER'], app.config['SESSION_TTL_SECONDS'])
+
+@app.route('/api/sessions', methods=['POST'])
+def new_session():
+    """Create an empty dataset session for a set of uploads"""
+    return jsonify({'session_id': start_session()})
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
@@ -40,49 +87,210 @@ def upload_file():
     
     files = request.files.getlist('file')
     file_types = request.form.get('fileTypes', 'current')  # 'current', 'historical', 'maintenance'
+    if file_types not in DATA_TYPES:
+        return jsonify({'error': f"Unknown data type '{file_types}'. Expected one of {DATA_TYPES}"}), 400
+    
+    session_id = request.form.get('session_id') or start_session()
+    
+    try:
+        session_folder = get_session_folder(app.config['UPLOAD_FOLDER'], session_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not os.path.isdir(session_folder):
+        return jsonify({'error': f'Session {session_id} not found'}), 404
     
     file_paths = []
     for file in files:
         if file and allowed_file(file.filename):
             from werkzeug.utils import secure_filename
             filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_types}_{filename}")
+            file_path = os.path.join(session_folder, f"{file_types}_{filename}")
             file.save(file_path)
             file_paths.append(file_path)
     
-    return jsonify({'message': f'Uploaded {len(file_paths)} files successfully', 'file_paths': file_paths})
+    try:
+        add_session_files(app.config['UPLOAD_FOLDER'], session_id, file_types, file_paths)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'message': f'Uploaded {len(file_paths)} files successfully',
+        'session_id': session_id,
+        'file_paths': file_paths
+    })
+
+def load_request_datasets(session_id, current_data_paths=(), historical_data_paths=(), maintenance_data_paths=()):
+    """
+    Load the datasets for a request from its session, or from explicit file paths
+    
+    Parameters:
+    session_id (str or None): Dataset session ID
+    current_data_paths (list): Current data file paths, used when there is no session
+    historical_data_paths (list): Historical data file paths, used when there is no session
+    maintenance_data_paths (list): Maintenance data file paths, used when there is no session
+    
+    Returns:
+    tuple: (current_data, historical_data, maintenance_data, sources), where sources holds the
+           'files' the DataFrames were loaded from and their 'digests' (None without a session)
+    """
+    if session_id:
+        session = load_session(
+            app.config['UPLOAD_FOLDER'], session_id,
+            max_sessions=app.config['SESSION_CACHE_SIZE'],
+            ttl_seconds=app.config['SESSION_TTL_SECONDS']
+        )
+        datasets = session['datasets']
+        return (datasets['current'], datasets['historical'], datasets['maintenance'],
+                {'files': session['files'], 'digests': session['digests']})
+    
+    return (
+        load_datasets(current_data_paths),
+        load_datasets(historical_data_paths),
+        load_datasets(maintenance_data_paths),
+        {
+            'files': {
+                'current': current_data_paths,
+                'historical': historical_data_paths,
+                'maintenance': maintenance_data_paths
+            },
+            'digests': None
+        }
+    )
 
 @app.route('/api/analyze', methods=['POST'])
 def analyze_data():
     data = request.json
+    session_id = data.get('session_id')
     current_data_paths = data.get('current_data_paths', [])
     historical_data_paths = data.get('historical_data_paths', [])
     maintenance_data_paths = data.get('maintenance_data_paths', [])
     manual_ranges = data.get('manual_ranges', {})  # {section_id: [min_pci, max_pci]}
+    detectors = data.get('detectors')  # e.g. ['pci_outliers', 'multivariate'], None for all
+    max_cost = data.get('max_cost')  # 'fast', 'moderate' or 'slow', None for all
+    
+    if data.get('profile') and not g.profiling:
+        g.profiling = True
+        start_profile()
     
     # Load datasets
-    current_data = load_datasets(current_data_paths)
-    historical_data = load_datasets(historical_data_paths)
-    maintenance_data = load_datasets(maintenance_data_paths)
+    try:
+        current_data, historical_data, maintenance_data, sources = load_request_datasets(
+            session_id, current_data_paths, historical_data_paths, maintenance_data_paths
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
     
     if current_data.empty:
         return jsonify({'error': 'No current data found'}), 400
     
-    # Run anomaly detection with manual ranges
-    anomalies = detect_anomalies(current_data, historical_data, maintenance_data)
+    # Run the selected anomaly detectors
+    # Intermediate results (e.g. the paired PCI table) shared by detectors and plots; the
+    # historical and maintenance indexes persisted for the loaded source files are loaded on first use
+    shared = {'load_index': make_index_loader(
+        app.config['INDEX_FOLDER'], sources['files'], file_digests=sources['digests']
+    )}
+    try:
+        anomalies, detector_stats = run_detectors(
+            current_data, historical_data, maintenance_data, detectors, max_cost, shared
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if session_id:
+        # Keep the full result set on disk so exports don't have to round-trip it through the browser
+        with track_stage('save_anomalies') as stage:
+            stage['rows'] = len(anomalies)
+            save_anomalies(get_session_folder(app.config['UPLOAD_FOLDER'], session_id), anomalies)
     
     # Generate visualizations
-    plots = generate_visualizations(current_data, historical_data, anomalies)
+    plots = generate_visualizations(current_data, historical_data, anomalies, shared)
     
-    return jsonify({
+    result = {
         'anomalies': anomalies,
         'visualizations': plots,
+        'detector_stats': detector_stats,
         'summary': {
             'total_sections': len(current_data),
             'anomalies_count': len(anomalies),
             'review_percentage': round(len(anomalies) / len(current_data) * 100, 2) if len(current_data) > 0 else 0
         }
-    })
+    }
+    
+    if g.profiling:
+        # Serialization itself is only reported in the Server-Timing header
+        result['profile'] = get_profile()
+    
+    with track_stage('serialize.analyze') as stage:
+        stage['rows'] = len(anomalies)
+        response = jsonify(result)
+    
+    return response
+
+def get_list_arg(name):
+    # Absent means no filter; present but empty means nothing is selected
+    value = request.args.get(name)
+    if value is None:
+        return None
+    return [item for item in value.split(',') if item]
+
+@app.route('/api/sessions/<session_id>/anomalies', methods=['GET'])
+def export_anomalies(session_id):
+    """
+    Stream a session's stored anomalies joined with their current section attributes
+    
+    Query parameters:
+    format: 'csv' (default), 'xlsx' or 'parquet'
+    confidence, review_type: comma-separated values to keep
+    search: text the section ID, reason, confidence or review type must contain
+    min_pci, max_pci: section PCI bounds; sections without a PCI always pass
+    pci_ranges: comma-separated 'start-end' PCI ranges, at least one of which must match
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format '{export_format}'. Expected one of {list(EXPORT_FORMATS)}"}), 400
+    
+    if export_format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return jsonify({'error': "Parquet export needs pyarrow. Run 'pip install pyarrow'"}), 501
+    
+    try:
+        min_pci = parse_pci_bound(request.args.get('min_pci'), 'min_pci')
+        max_pci = parse_pci_bound(request.args.get('max_pci'), 'max_pci')
+        if min_pci is not None and max_pci is not None and min_pci > max_pci:
+            raise ValueError(f'min_pci ({min_pci:g}) is greater than max_pci ({max_pci:g})')
+        pci_ranges = parse_pci_ranges(request.args.get('pci_ranges'))
+        session_folder = get_session_folder(app.config['UPLOAD_FOLDER'], session_id)
+        current_data, _, _, _ = load_request_datasets(session_id)
+        anomaly_df = load_anomalies(session_folder)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
+    
+    anomaly_df = filter_anomalies(
+        anomaly_df,
+        confidence=get_list_arg('confidence'),
+        review_type=get_list_arg('review_type'),
+        search=request.args.get('search')
+    )
+    chunks = iter_export_chunks(anomaly_df, current_data, min_pci, max_pci, pci_ranges)
+    
+    columns = get_export_columns(anomaly_df, current_data)
+    filename = f'pavement_anomalies_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.{EXPORT_FORMATS[export_format]["extension"]}'
+    headers = {'Content-Disposition': f'attachment; filename={filename}'}
+    
+    if export_format == 'csv':
+        body = stream_csv(chunks, columns)
+    else:
+        # Excel and Parquet files are only valid once complete, so build them on disk and stream the file
+        body = stream_file(export_to_temp_file(export_format, chunks, columns))
+    
+    return Response(body, mimetype=EXPORT_FORMATS[export_format]['mimetype'], headers=headers)
 
 @app.route('/api/sample-data', methods=['GET'])
 def get_sample_data():
@@ -94,40 +302,38 @@ def get_sample_data():
 @app.route('/api/export-for-minitab', methods=['GET'])
 def export_for_minitab():
     """
-    Export all data in a Minitab-compatible format
+    Export a session's data in a Minitab-compatible format
     """
+    session_id = request.args.get('session_id')
+    if not session_id:
+        return jsonify({'error': 'No session_id given. Upload data before exporting.'}), 400
+    
     try:
-        print("Starting export for Minitab")
-        # Get all data from upload folder
-        current_data_paths = [os.path.join(app.config['UPLOAD_FOLDER'], f) for f in os.listdir(app.config['UPLOAD_FOLDER']) 
-                             if f.startswith('current_') and os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], f))]
-        
-        historical_data_paths = [os.path.join(app.config['UPLOAD_FOLDER'], f) for f in os.listdir(app.config['UPLOAD_FOLDER']) 
-                               if f.startswith('historical_') and os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], f))]
-        
-        maintenance_data_paths = [os.path.join(app.config['UPLOAD_FOLDER'], f) for f in os.listdir(app.config['UPLOAD_FOLDER']) 
-                                if f.startswith('maintenance_') and os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], f))]
-        
-        print(f"Found data files - Current: {len(current_data_paths)}, Historical: {len(historical_data_paths)}, Maintenance: {len(maintenance_data_paths)}")
+        print(f"Starting export for Minitab for session {session_id}")
         
         # Load datasets
-        current_data = load_datasets(current_data_paths)
-        historical_data = load_datasets(historical_data_paths)
-        maintenance_data = load_datasets(maintenance_data_paths)
+        try:
+            current_data, historical_data, maintenance_data, _ = load_request_datasets(session_id)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except KeyError as e:
+            return jsonify({'error': e.args[0]}), 404
         
         # Create combined dataset for Minitab
         combined_data = create_minitab_dataset(current_data, historical_data, maintenance_data)
         
         # Convert to CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow(combined_data.columns)
-        
-        # Write data
-        for _, row in combined_data.iterrows():
-            writer.writerow(row)
+        with track_stage('serialize.minitab_export') as stage:
+            stage['rows'] = len(combined_data)
+            output = io.StringIO()
+            writer = csv.writer(output)
+            
+            # Write header
+            writer.writerow(combined_data.columns)
+            
+            # Write data
+            for _, row in combined_data.iterrows():
+                writer.writerow(row)
         
         # Create response
         response = Response(
@@ -145,180 +351,6 @@ def export_for_minitab():
         print(f"Error exporting for Minitab: {e}")
         return jsonify({'error': str(e)}), 500
 
-def create_minitab_dataset(current_data, historical_data, maintenance_data):
-    """
-    Create a combined dataset optimized for Minitab analysis
-    
-    Parameters:
-    current_data (pandas.DataFrame): Current PMP data
-    historical_data (pandas.DataFrame): Historical PMP data
-    maintenance_data (pandas.DataFrame): Maintenance history data
-    
-    Returns:
-    pandas.DataFrame: Combined dataset for Minitab
-    """
-    print("Starting to create Minitab dataset")
-    
-    # Start with current data
-    minitab_data = current_data.copy()
-    
-    # Add data source identifier
-    minitab_data['data_source'] = 'current'
-    
-    # Extract section IDs for joining
-    section_id_col = get_section_id_column(current_data)
-    print(f"Using section ID column: {section_id_col}")
-    
-    # Get PCI columns
-    pci_col_current = get_pci_column(current_data)
-    print(f"Using PCI column: {pci_col_current}")
-    
-    # Add columns for Minitab analysis if they don't exist
-    if pci_col_current and pci_col_current in minitab_data.columns:
-        print(f"Adding PCI categories for Minitab analysis")
-        # Create PCI categories for stratified analysis using numpy select instead of pd.cut
-        if 'pci_category' not in minitab_data.columns:
-            try:
-                # Create conditions for each category
-                conditions = [
-                    (minitab_data[pci_col_current] < 25),
-                    (minitab_data[pci_col_current] >= 25) & (minitab_data[pci_col_current] < 50),
-                    (minitab_data[pci_col_current] >= 50) & (minitab_data[pci_col_current] < 75),
-                    (minitab_data[pci_col_current] >= 75)
-                ]
-                choices = ['Poor', 'Fair', 'Good', 'Excellent']
-                minitab_data['pci_category'] = np.select(conditions, choices, default='Unknown')
-                print("PCI categories created successfully")
-            except Exception as e:
-                print(f"Error creating PCI categories: {e}")
-                # If there's an error, skip adding this column
-                pass
-    
-    # Add historical data comparison if available
-    if not historical_data.empty and section_id_col in historical_data.columns:
-        print("Adding historical data comparison")
-        pci_col_historical = get_pci_column(historical_data)
-        
-        if pci_col_historical:
-            try:
-                # Get historical PCI values
-                historical_pci = historical_data[[section_id_col, pci_col_historical]].copy()
-                historical_pci.columns = [section_id_col, 'historical_pci']
-                
-                # Add to minitab data
-                minitab_data = pd.merge(
-                    minitab_data,
-                    historical_pci,
-                    on=section_id_col,
-                    how='left'
-                )
-                
-                # Calculate PCI change
-                if pci_col_current and 'historical_pci' in minitab_data.columns:
-                    minitab_data['pci_change'] = minitab_data[pci_col_current] - minitab_data['historical_pci']
-                    
-                    # Calculate annual rate of change if dates are available
-                    date_cols_current = get_date_columns(current_data)
-                    date_cols_historical = get_date_columns(historical_data)
-                    
-                    if date_cols_current and date_cols_historical:
-                        try:
-                            # Add dates for time-based analysis
-                            current_dates = current_data[[section_id_col, date_cols_current[0]]].copy()
-                            current_dates.columns = [section_id_col, 'current_date']
-                            
-                            historical_dates = historical_data[[section_id_col, date_cols_historical[0]]].copy()
-                            historical_dates.columns = [section_id_col, 'historical_date']
-                            
-                            # Merge dates
-                            minitab_data = pd.merge(minitab_data, current_dates, on=section_id_col, how='left')
-                            minitab_data = pd.merge(minitab_data, historical_dates, on=section_id_col, how='left')
-                            
-                            # Convert to datetime
-                            minitab_data['current_date'] = pd.to_datetime(minitab_data['current_date'])
-                            minitab_data['historical_date'] = pd.to_datetime(minitab_data['historical_date'])
-                            
-                            # Calculate years between measurements
-                            minitab_data['years_between'] = (minitab_data['current_date'] - minitab_data['historical_date']).dt.days / 365.25
-                            
-                            # Calculate annual rate of deterioration
-                            minitab_data['annual_deterioration'] = minitab_data['pci_change'] / minitab_data['years_between']
-                            
-                            print("Historical comparison metrics calculated successfully")
-                        except Exception as e:
-                            print(f"Error calculating date-based metrics: {e}")
-                            # Continue without these metrics if there's an error
-            except Exception as e:
-                print(f"Error processing historical data: {e}")
-    
-    # Add maintenance information if available
-    if not maintenance_data.empty and section_id_col in maintenance_data.columns:
-        print("Adding maintenance information")
-        try:
-            # Flag for sections with maintenance
-            sections_with_maintenance = maintenance_data[section_id_col].unique()
-            minitab_data['has_maintenance'] = minitab_data[section_id_col].isin(sections_with_maintenance)
-            minitab_data['has_maintenance'] = minitab_data['has_maintenance'].astype(int)  # Convert boolean to 0/1 for Minitab
-            
-            # Get maintenance count for each section
-            maintenance_counts = maintenance_data.groupby(section_id_col).size().reset_index(name='maintenance_count')
-            minitab_data = pd.merge(minitab_data, maintenance_counts, on=section_id_col, how='left')
-            minitab_data['maintenance_count'] = minitab_data['maintenance_count'].fillna(0)
-            
-            # Get latest maintenance date and type if available
-            maint_date_cols = get_date_columns(maintenance_data)
-            if maint_date_cols:
-                # Create a dataframe with latest maintenance information
-                maintenance_data['maintenance_date'] = pd.to_datetime(maintenance_data[maint_date_cols[0]])
-                
-                # Group by section_id and find the latest maintenance date
-                latest_maint_indices = maintenance_data.groupby(section_id_col)['maintenance_date'].idxmax()
-                latest_maintenance = maintenance_data.loc[latest_maint_indices]
-                
-                # Get maintenance type
-                maint_type_cols = [col for col in maintenance_data.columns if 'type' in col.lower() or 'work' in col.lower()]
-                if maint_type_cols:
-                    try:
-                        maint_type_col = maint_type_cols[0]
-                        latest_maintenance_subset = latest_maintenance[[section_id_col, 'maintenance_date', maint_type_col]].copy()
-                        latest_maintenance_subset.columns = [section_id_col, 'latest_maintenance_date', 'latest_maintenance_type']
-                        
-                        # Merge with minitab data
-                        minitab_data = pd.merge(minitab_data, latest_maintenance_subset, on=section_id_col, how='left')
-                        
-                        # Calculate time since last maintenance
-                        if 'current_date' in minitab_data.columns and 'latest_maintenance_date' in minitab_data.columns:
-                            # Convert to datetime again if needed
-                            if not pd.api.types.is_datetime64_dtype(minitab_data['current_date']):
-                                minitab_data['current_date'] = pd.to_datetime(minitab_data['current_date'])
-                            
-                            # Calculate years since maintenance where maintenance data exists
-                            mask = ~minitab_data['latest_maintenance_date'].isna()
-                            if mask.any():
-                                minitab_data.loc[mask, 'years_since_maintenance'] = (
-                                    minitab_data.loc[mask, 'current_date'] - 
-                                    minitab_data.loc[mask, 'latest_maintenance_date']
-                                ).dt.days / 365.25
-                            
-                            print("Maintenance metrics calculated successfully")
-                    except Exception as e:
-                        print(f"Error processing maintenance type information: {e}")
-                        
-        except Exception as e:
-            print(f"Error processing maintenance data for Minitab: {e}")
-    
-    # Clean up any missing values for Minitab compatibility
-    # Convert all object columns containing NaN to string type
-    for col in minitab_data.select_dtypes(include=['object']).columns:
-        minitab_data[col] = minitab_data[col].astype(str)
-        minitab_data[col] = minitab_data[col].replace('nan', '')
-    
-    # Fill numeric NaN values with 0
-    minitab_data = minitab_data.fillna(0)
-    
-    print("Minitab dataset created successfully")
-    return minitab_data
-
 if __name__ == '__main__':
     print("Server starting... Open http://localhost:5000 in your browser")
     app.run(debug=True)
\ No newline at end of file
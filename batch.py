@@ -0,0 +1,248 @@
+"""
+Run pavement QA over many datasets without the web server
+
+The manifest is a JSON list of jobs. Paths are relative to the manifest file:
+
+    [
+        {"name": "county_a",
+         "current": ["county_a/current.csv"],
+         "historical": ["county_a/historical.csv"],
+         "maintenance": ["county_a/maintenance.csv"]},
+        {"name": "county_b",
+         "current": ["county_b/survey_2023.xlsx"],
+         "sheet": "Sections"},
+        ...
+    ]
+
+"sheet" is optional and selects the Excel sheet to read from every workbook in the job;
+by default the sheet whose header has section ID and PCI columns is used.
+
+Each job writes anomalies.csv, minitab.csv and summary.json into <output>/<name>/.
+summary.json is written last, so a job that has one is complete and is skipped
+when the batch is rerun after an interruption.
+
+Historical and maintenance section indexes are kept in <output>/indexes/, keyed by
+the hashes of their source files, so jobs and reruns that share those files only
+build them once.
+
+Example:
+    python batch.py manifest.json --output qa_results --workers 32
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from data_processor import load_datasets, create_minitab_dataset
+from anomaly_detector import run_detectors, select_detectors
+from section_indexes import make_index_loader
+
+SUMMARY_FILE = 'summary.json'
+INDEX_SUBFOLDER = 'indexes'
+
+def load_manifest(manifest_path):
+    """
+    Read a batch manifest and resolve its file paths
+
+    Parameters:
+    manifest_path (str): Path to the JSON manifest
+
+    Returns:
+    list: Jobs as dictionaries with 'name', 'current', 'historical' and 'maintenance' keys
+    """
+    with open(manifest_path) as f:
+        entries = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    names = set()
+
+    for position, entry in enumerate(entries):
+        name = entry.get('name') or f'job_{position + 1}'
+        if not re.fullmatch(r'[\w.-]+', name):
+            raise ValueError(f"Job name '{name}' can only contain letters, digits, '_', '-' and '.'")
+        if name in names:
+            raise ValueError(f"Duplicate job name '{name}' in manifest")
+        if name == INDEX_SUBFOLDER:
+            raise ValueError(f"Job name '{name}' is reserved for the shared section indexes")
+        names.add(name)
+
+        job = {'name': name, 'sheet': entry.get('sheet')}
+        for data_type in ('current', 'historical', 'maintenance'):
+            paths = entry.get(data_type, [])
+            if isinstance(paths, str):
+                paths = [paths]
+            job[data_type] = [os.path.join(base_dir, path) for path in paths]
+
+        if not job['current']:
+            raise ValueError(f"Job '{name}' has no current data files")
+        jobs.append(job)
+
+    return jobs
+
+def is_complete(job, output_dir):
+    """
+    Check whether a job already finished in a previous run
+
+    Parameters:
+    job (dict): Job from load_manifest
+    output_dir (str): Batch output directory
+
+    Returns:
+    bool: True if the job's summary file exists
+    """
+    return os.path.exists(os.path.join(output_dir, job['name'], SUMMARY_FILE))
+
+def write_atomic(path, write):
+    """
+    Write a file via a temporary name so interrupted runs never leave partial outputs
+
+    Parameters:
+    path (str): Final file path
+    write (callable): Called with the temporary path to write to
+    """
+    temp_path = f'{path}.tmp'
+    write(temp_path)
+    os.replace(temp_path, path)
+
+def run_job(job, output_dir, detectors=None, max_cost=None, roles_only=False):
+    """
+    Load one job's datasets, detect anomalies and write its outputs
+
+    Parameters:
+    job (dict): Job from load_manifest
+    output_dir (str): Batch output directory
+    detectors (list): Detector names to run, or None for all
+    max_cost (str): Most expensive detector cost class to run, or None for all
+    roles_only (bool): Only load columns used by the detectors
+
+    Returns:
+    dict: Job summary
+    """
+    start_time = time.perf_counter()
+    job_dir = os.path.join(output_dir, job['name'])
+    os.makedirs(job_dir, exist_ok=True)
+
+    # Each job already runs in its own worker process, so parse its workbooks serially
+    load_options = {'sheet_name': job.get('sheet'), 'roles_only': roles_only, 'max_workers': 1}
+    current_data = load_datasets(job['current'], **load_options)
+    historical_data = load_datasets(job['historical'], **load_options)
+    maintenance_data = load_datasets(job['maintenance'], **load_options)
+
+    if current_data.empty:
+        raise ValueError('No current data found')
+
+    shared = {'load_index': make_index_loader(
+        os.path.join(output_dir, INDEX_SUBFOLDER), job,
+        load_options={'sheet_name': job.get('sheet'), 'roles_only': roles_only}
+    )}
+    anomalies, detector_stats = run_detectors(
+        current_data, historical_data, maintenance_data, detectors, max_cost, shared
+    )
+
+    anomaly_df = pd.DataFrame(anomalies, columns=['section_id', 'reason', 'review_type', 'confidence', 'detector'])
+    write_atomic(os.path.join(job_dir, 'anomalies.csv'), lambda path: anomaly_df.to_csv(path, index=False))
+
+    minitab_data = create_minitab_dataset(current_data, historical_data, maintenance_data)
+    write_atomic(os.path.join(job_dir, 'minitab.csv'), lambda path: minitab_data.to_csv(path, index=False))
+
+    summary = {
+        'name': job['name'],
+        'total_sections': len(current_data),
+        'anomalies_count': len(anomalies),
+        'review_percentage': round(len(anomalies) / len(current_data) * 100, 2),
+        'detector_stats': detector_stats,
+        'seconds': round(time.perf_counter() - start_time, 3)
+    }
+
+    def write_summary(path):
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=2, default=str)
+
+    write_atomic(os.path.join(job_dir, SUMMARY_FILE), write_summary)
+    return summary
+
+def run_batch(jobs, output_dir, workers=None, detectors=None, max_cost=None, force=False, roles_only=False):
+    """
+    Run jobs in a process pool, skipping jobs completed by a previous run
+
+    Parameters:
+    jobs (list): Jobs from load_manifest
+    output_dir (str): Batch output directory
+    workers (int): Number of worker processes, defaults to the number of CPUs
+    detectors (list): Detector names to run, or None for all
+    max_cost (str): Most expensive detector cost class to run, or None for all
+    force (bool): Rerun jobs even if they already completed
+    roles_only (bool): Only load columns used by the detectors
+
+    Returns:
+    dict: {'completed': [...], 'skipped': [...], 'failed': {name: error}}
+    """
+    # Fail on unknown detector names before starting any workers
+    select_detectors(detectors, max_cost)
+    os.makedirs(output_dir, exist_ok=True)
+
+    pending = [job for job in jobs if force or not is_complete(job, output_dir)]
+    result = {
+        'completed': [],
+        'skipped': [job['name'] for job in jobs if job not in pending],
+        'failed': {}
+    }
+
+    if result['skipped']:
+        print(f"Skipping {len(result['skipped'])} completed jobs")
+
+    if not pending:
+        return result
+
+    workers = min(workers or os.cpu_count() or 1, len(pending))
+    print(f"Running {len(pending)} jobs on {workers} workers")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(run_job, job, output_dir, detectors, max_cost, roles_only): job['name']
+            for job in pending
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                summary = future.result()
+                result['completed'].append(name)
+                print(f"[{len(result['completed']) + len(result['failed'])}/{len(pending)}] {name}: "
+                      f"{summary['anomalies_count']} anomalies in {summary['total_sections']} sections "
+                      f"({summary['seconds']}s)")
+            except Exception as e:
+                result['failed'][name] = str(e)
+                print(f"Error processing job {name}: {e}")
+
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run pavement QA/QC over a manifest of datasets')
+    parser.add_argument('manifest', help='JSON manifest of current/historical/maintenance file sets')
+    parser.add_argument('--output', default='qa_results', help='Output directory')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--detectors', nargs='+', help='Detector names to run (default: all)')
+    parser.add_argument('--max-cost', choices=['fast', 'moderate', 'slow'],
+                        help='Most expensive detector cost class to run')
+    parser.add_argument('--force', action='store_true', help='Rerun jobs that already completed')
+    parser.add_argument('--roles-only', action='store_true',
+                        help='Only load columns the detectors use (Minitab exports then omit other columns)')
+    args = parser.parse_args(argv)
+
+    jobs = load_manifest(args.manifest)
+    result = run_batch(jobs, args.output, args.workers, args.detectors, args.max_cost, args.force, args.roles_only)
+
+    with open(os.path.join(args.output, 'batch_summary.json'), 'w') as f:
+        json.dump(result, f, indent=2)
+
+    print(f"Completed {len(result['completed'])}, skipped {len(result['skipped'])}, failed {len(result['failed'])}")
+    return 1 if result['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
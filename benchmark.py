@@ -0,0 +1,270 @@
+"""
+Benchmark the analysis pipeline on synthetic pavement networks
+
+Examples:
+    python benchmark.py --sizes 1000 100000 1000000 --output bench_results.json
+    python benchmark.py --sizes 1000 100000 --baseline bench_baseline.json
+"""
+import argparse
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import datetime
+
+import pandas as pd
+
+from data_processor import load_datasets, create_minitab_dataset
+from anomaly_detector import run_detectors, generate_visualizations
+from metrics import track_stage, start_profile, finish_profile, get_max_rss_bytes
+from synthetic_data import generate_network, write_network
+
+def run_benchmark(n_sections, work_dir, seed=0, anomaly_rate=0.01, slow_limit=10000,
+                  detectors=None, include_plots=False, trace_memory=True):
+    """
+    Generate a network of the given size, run the pipeline on it and time each stage
+
+    Parameters:
+    n_sections (int): Number of road sections
+    work_dir (str): Directory for the generated CSV files
+    seed (int): Random seed for the generator
+    anomaly_rate (float): Fraction of sections injected with each anomaly type
+    slow_limit (int): Largest size at which 'slow' detectors are run
+    detectors (list): Detector names to run, or None for all
+    include_plots (bool): Whether to time generate_visualizations
+    trace_memory (bool): Whether to record peak memory per stage (slows stages down)
+
+    Returns:
+    dict: Stage timings, detector statistics and anomaly recovery for this size
+    """
+    max_cost = None if n_sections <= slow_limit else 'moderate'
+
+    start_profile(trace_memory=trace_memory)
+    try:
+        with track_stage('generate') as stage:
+            network = generate_network(n_sections, anomaly_rate=anomaly_rate, seed=seed)
+            stage['rows'] = n_sections
+
+        with track_stage('write') as stage:
+            paths = write_network(network, work_dir, prefix=f'bench_{n_sections}_')
+            stage['rows'] = n_sections
+
+        datasets = {}
+        for key in ('current', 'historical', 'maintenance'):
+            with track_stage(f'load.{key}') as stage:
+                datasets[key] = load_datasets([paths[key]])
+                stage['rows'] = len(datasets[key])
+
+        anomalies, detector_stats = run_detectors(
+            datasets['current'], datasets['historical'], datasets['maintenance'], detectors, max_cost
+        )
+
+        create_minitab_dataset(datasets['current'], datasets['historical'], datasets['maintenance'])
+
+        if include_plots:
+            generate_visualizations(datasets['current'], datasets['historical'], anomalies)
+    finally:
+        stages = finish_profile()
+
+    return {
+        'sections': n_sections,
+        'stages': summarize_stages(stages),
+        'detectors': detector_stats,
+        'recovery': measure_recovery(network['injected'], anomalies, detector_stats),
+        'anomalies': len(anomalies),
+        'max_rss_bytes': get_max_rss_bytes()
+    }
+
+def summarize_stages(stages):
+    """
+    Combine repeated stage records into one entry per stage name
+
+    Parameters:
+    stages (list): Stage records from finish_profile()
+
+    Returns:
+    dict: {stage: {'seconds', 'rows', 'peak_memory_bytes'}}
+    """
+    summary = {}
+    for stage in stages:
+        if 'seconds' not in stage:
+            continue
+        totals = summary.setdefault(stage['name'], {'seconds': 0.0, 'rows': 0})
+        totals['seconds'] = round(totals['seconds'] + stage['seconds'], 6)
+        totals['rows'] += int(stage.get('rows') or 0)
+        if 'peak_memory_bytes' in stage:
+            totals['peak_memory_bytes'] = max(totals.get('peak_memory_bytes', 0), stage['peak_memory_bytes'])
+    return summary
+
+def measure_recovery(injected, anomalies, detector_stats):
+    """
+    Check how many injected anomalies were flagged by the detector expected to find them
+
+    Parameters:
+    injected (pandas.DataFrame): Injected anomalies from generate_network
+    anomalies (list): Detected anomalies
+    detector_stats (list): Per-detector statistics from run_detectors
+
+    Returns:
+    dict: {anomaly_type: {'detector', 'injected', 'recovered', 'recall'}}, with recall None
+          when the expected detector did not run
+    """
+    ran = {stats['name'] for stats in detector_stats if stats['status'] == 'ran'}
+    flagged = pd.DataFrame(anomalies, columns=['section_id', 'detector']).drop_duplicates()
+
+    recovery = {}
+    for anomaly_type, group in injected.groupby('anomaly_type'):
+        detector = group['expected_detector'].iloc[0]
+        found = set(flagged.loc[flagged['detector'] == detector, 'section_id'])
+        recovered = int(group['section_id'].isin(found).sum())
+        recovery[anomaly_type] = {
+            'detector': detector,
+            'injected': len(group),
+            'recovered': recovered,
+            'recall': round(recovered / len(group), 4) if detector in ran and len(group) else None
+        }
+    return recovery
+
+def compare_to_baseline(results, baseline, tolerance=0.25, min_seconds=0.05):
+    """
+    Find stages that got slower or used more memory than in a stored baseline
+
+    Parameters:
+    results (dict): Benchmark results
+    baseline (dict): Baseline results in the same format
+    tolerance (float): Allowed relative increase before a stage counts as a regression
+    min_seconds (float): Absolute slowdowns below this are treated as noise
+
+    Returns:
+    list: Regression descriptions
+    """
+    regressions = []
+    for size, run in results['runs'].items():
+        base_run = baseline.get('runs', {}).get(size)
+        if not base_run:
+            continue
+
+        for name, stage in run['stages'].items():
+            base_stage = base_run['stages'].get(name)
+            if not base_stage:
+                continue
+
+            if (stage['seconds'] > base_stage['seconds'] * (1 + tolerance)
+                    and stage['seconds'] - base_stage['seconds'] > min_seconds):
+                regressions.append(
+                    f"{size} sections, {name}: {stage['seconds']:.3f}s vs baseline {base_stage['seconds']:.3f}s"
+                )
+
+            memory, base_memory = stage.get('peak_memory_bytes'), base_stage.get('peak_memory_bytes')
+            if memory and base_memory and memory > base_memory * (1 + tolerance):
+                regressions.append(
+                    f"{size} sections, {name}: peak memory {memory / 1e6:.1f}MB vs baseline {base_memory / 1e6:.1f}MB"
+                )
+
+    return regressions
+
+def print_report(run):
+    """
+    Print a stage and recovery table for one benchmark run
+
+    Parameters:
+    run (dict): Result of run_benchmark
+    """
+    print(f"\n=== {run['sections']:,} sections ===")
+    print(f"{'stage':<40}{'seconds':>12}{'rows':>12}{'peak MB':>12}")
+    for name, stage in run['stages'].items():
+        peak = stage.get('peak_memory_bytes')
+        peak_text = f"{peak / 1e6:.1f}" if peak is not None else '-'
+        print(f"{name:<40}{stage['seconds']:>12.3f}{stage['rows']:>12,}{peak_text:>12}")
+
+    skipped = [stats['name'] for stats in run['detectors'] if stats['status'] == 'skipped']
+    if skipped:
+        print(f"Skipped detectors: {', '.join(skipped)}")
+
+    print(f"{'injected anomaly':<30}{'detector':<30}{'recovered':>12}{'recall':>10}")
+    for anomaly_type, recovery in run['recovery'].items():
+        recall = f"{recovery['recall']:.2f}" if recovery['recall'] is not None else 'n/a'
+        print(f"{anomaly_type:<30}{recovery['detector']:<30}"
+              f"{recovery['recovered']:>6}/{recovery['injected']:<5}{recall:>10}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the pavement QA/QC pipeline on synthetic data')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000],
+                        help='Network sizes (number of sections) to benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the generator')
+    parser.add_argument('--anomaly-rate', type=float, default=0.01,
+                        help='Fraction of sections injected with each anomaly type')
+    parser.add_argument('--slow-limit', type=int, default=10000,
+                        help="Largest size at which detectors with cost class 'slow' are run")
+    parser.add_argument('--detectors', nargs='+', help='Detector names to run (default: all)')
+    parser.add_argument('--plots', action='store_true', help='Also time generate_visualizations')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='Skip per-stage peak memory tracing for cleaner timings')
+    parser.add_argument('--min-recall', type=float, default=0.9,
+                        help='Fail if any detector that ran recovers less than this fraction of its injected anomalies')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against results stored in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed relative slowdown against the baseline')
+    parser.add_argument('--work-dir', help='Directory for generated files (default: a temporary directory)')
+    args = parser.parse_args(argv)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='pavement_bench_')
+    results = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'seed': args.seed,
+        'runs': {}
+    }
+
+    try:
+        for n_sections in args.sizes:
+            run = run_benchmark(
+                n_sections, work_dir, seed=args.seed, anomaly_rate=args.anomaly_rate,
+                slow_limit=args.slow_limit, detectors=args.detectors,
+                include_plots=args.plots, trace_memory=not args.no_memory
+            )
+            results['runs'][str(n_sections)] = run
+            print_report(run)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    failed = False
+
+    low_recall = [
+        f"{size} sections, {anomaly_type}: recall {recovery['recall']:.2f}"
+        for size, run in results['runs'].items()
+        for anomaly_type, recovery in run['recovery'].items()
+        if recovery['recall'] is not None and recovery['recall'] < args.min_recall
+    ]
+    if low_recall:
+        failed = True
+        print("\nInjected anomalies not recovered:")
+        for line in low_recall:
+            print(f"  {line}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, tolerance=args.tolerance)
+        if regressions:
+            failed = True
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+        else:
+            print("\nNo regressions against baseline")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"\nResults written to {args.output}")
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
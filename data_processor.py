@@ -1,26 +1,32 @@
+import datetime
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
+import numpy as np
+
+from metrics import track_stage, timed_stage
 
-def load_datasets(file_paths):
+def load_datasets(file_paths, sheet_name=None, roles_only=False, max_workers=None):
     """
     Load and combine multiple datasets from file paths
     
     Parameters:
     file_paths (list): List of paths to CSV or Excel files
+    sheet_name (str): Excel sheet to read; by default the sheet whose header has section ID and PCI columns
+    roles_only (bool): Only read columns used by the column-role detection (IDs, PCI, dates, etc.)
+    max_workers (int): Processes used to parse several Excel workbooks at once, defaults to the number of CPUs
     
     Returns:
     pandas.DataFrame: Combined dataset
     """
-    combined_df = pd.DataFrame()
+    with track_stage('load_datasets') as stage:
+        combined_df = pd.DataFrame()
     
-    for file_path in file_paths:
-        try:
-            if file_path.endswith('.csv'):
-                df = pd.read_csv(file_path)
-            elif file_path.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(file_path)
-            else:
+        for file_path, df in read_data_files(file_paths, sheet_name, roles_only, max_workers):
+            if df is None:
                 continue
-                
+            
             if combined_df.empty:
                 combined_df = df
             else:
@@ -31,11 +37,312 @@ def load_datasets(file_paths):
                     combined_df = pd.merge(combined_df, df, on=common_cols, how='outer')
                 else:
                     combined_df = pd.concat([combined_df, df], ignore_index=True)
-        except Exception as e:
-            print(f"Error loading file {file_path}: {e}")
+    
+        stage['rows'] = len(combined_df)
     
     return combined_df
 
+def read_data_files(file_paths, sheet_name=None, roles_only=False, max_workers=None):
+    """
+    Read several data files, parsing Excel workbooks concurrently in a process pool
+    
+    Parameters:
+    file_paths (list): List of paths to CSV or Excel files
+    sheet_name (str): Excel sheet to read, or None to pick one by its header
+    roles_only (bool): Only read columns used by the column-role detection
+    max_workers (int): Maximum number of parsing processes
+    
+    Returns:
+    list: (file_path, DataFrame or None) tuples in the order of file_paths; None for unreadable files
+    """
+    excel_paths = [path for path in file_paths if path.endswith(('.xlsx', '.xls'))]
+    results = {}
+    
+    # Excel parsing is pure-Python and CPU bound, so only a process pool helps
+    if len(excel_paths) > 1 and (max_workers is None or max_workers > 1):
+        workers = min(len(excel_paths), max_workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                path: executor.submit(read_data_file, path, sheet_name, roles_only)
+                for path in excel_paths
+            }
+            for path, future in futures.items():
+                try:
+                    results[path] = future.result()
+                except Exception as e:
+                    print(f"Error loading file {path}: {e}")
+                    results[path] = None
+    
+    loaded = []
+    for file_path in file_paths:
+        if file_path not in results:
+            try:
+                results[file_path] = read_data_file(file_path, sheet_name, roles_only)
+            except Exception as e:
+                print(f"Error loading file {file_path}: {e}")
+                results[file_path] = None
+        loaded.append((file_path, results[file_path]))
+    
+    return loaded
+
+def read_data_file(file_path, sheet_name=None, roles_only=False):
+    """
+    Read one CSV or Excel file
+    
+    Parameters:
+    file_path (str): Path to a CSV or Excel file
+    sheet_name (str): Excel sheet to read, or None to pick one by its header
+    roles_only (bool): Only read columns used by the column-role detection
+    
+    Returns:
+    pandas.DataFrame or None: Loaded data, or None for unsupported file types
+    """
+    if file_path.endswith('.csv'):
+        usecols = None
+        if roles_only:
+            usecols = get_role_columns(pd.read_csv(file_path, nrows=0).columns)
+        return pd.read_csv(file_path, usecols=usecols)
+    elif file_path.endswith('.xlsx'):
+        return read_xlsx_file(file_path, sheet_name, roles_only)
+    elif file_path.endswith('.xls'):
+        # Legacy workbooks aren't supported by openpyxl, so use pandas' default engine
+        excel_file = pd.ExcelFile(file_path)
+        if sheet_name is None:
+            headers = {
+                sheet: list(pd.read_excel(excel_file, sheet_name=sheet, nrows=0).columns)
+                for sheet in excel_file.sheet_names
+            }
+            sheet_name = select_data_sheet(headers)
+        usecols = None
+        if roles_only:
+            usecols = get_role_columns(pd.read_excel(excel_file, sheet_name=sheet_name, nrows=0).columns)
+        return pd.read_excel(excel_file, sheet_name=sheet_name, usecols=usecols)
+    return None
+
+def read_xlsx_file(file_path, sheet_name=None, roles_only=False):
+    """
+    Stream an .xlsx sheet in read-only mode into the same column types read_csv produces
+    
+    Parameters:
+    file_path (str): Path to the workbook
+    sheet_name (str): Sheet to read, or None to pick one by its header
+    roles_only (bool): Only read columns used by the column-role detection
+    
+    Returns:
+    pandas.DataFrame: Loaded data
+    """
+    return next(iter_xlsx_chunks(file_path, sheet_name, roles_only))
+
+def read_xlsx_header(workbook, sheet_name=None):
+    """
+    Find the sheet to read in an open workbook and its header row
+    
+    Parameters:
+    workbook (openpyxl.Workbook): Workbook opened in read-only mode
+    sheet_name (str): Sheet to read, or None to pick one by its header
+    
+    Returns:
+    tuple: (sheet name, list of header names with '' for empty cells)
+    """
+    # Only the header row of each sheet is needed to choose one
+    headers = {}
+    for worksheet in workbook.worksheets:
+        if sheet_name is not None and worksheet.title != sheet_name:
+            continue
+        first_row = next(worksheet.iter_rows(max_row=1, values_only=True), ())
+        headers[worksheet.title] = [str(value).strip() if value is not None else '' for value in first_row]
+    
+    if sheet_name is not None and sheet_name not in headers:
+        raise ValueError(f"Sheet '{sheet_name}' not found")
+    
+    sheet_name = sheet_name if sheet_name is not None else select_data_sheet(headers)
+    return sheet_name, headers[sheet_name]
+
+def iter_xlsx_chunks(file_path, sheet_name=None, roles_only=False, chunk_rows=None):
+    """
+    Stream an .xlsx sheet in read-only mode as DataFrames of at most chunk_rows rows
+    
+    Parameters:
+    file_path (str): Path to the workbook
+    sheet_name (str): Sheet to read, or None to pick one by its header
+    roles_only (bool): Only read columns used by the column-role detection
+    chunk_rows (int): Rows per DataFrame, or None to read the whole sheet into one
+    
+    Yields:
+    pandas.DataFrame: Loaded rows; a sheet without data rows yields one empty frame
+    """
+    from openpyxl import load_workbook
+    
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet_name, header = read_xlsx_header(workbook, sheet_name)
+        
+        wanted = [name for name in header if name]
+        if roles_only:
+            wanted = get_role_columns(wanted)
+        keep = [position for position, name in enumerate(header) if name in wanted]
+        
+        def build_chunk(columns):
+            return pd.DataFrame({header[position]: convert_excel_values(values) for position, values in zip(keep, columns)})
+        
+        columns = [[] for _ in keep]
+        n_rows = 0
+        yielded = False
+        if keep:
+            worksheet = workbook[sheet_name]
+            for row in worksheet.iter_rows(min_row=2, max_col=keep[-1] + 1, values_only=True):
+                values = [row[position] if position < len(row) else None for position in keep]
+                # Formatted but empty trailing rows are common in exported workbooks
+                if all(value is None for value in values):
+                    continue
+                for column, value in zip(columns, values):
+                    column.append(value)
+                n_rows += 1
+                
+                if chunk_rows and n_rows == chunk_rows:
+                    yield build_chunk(columns)
+                    yielded = True
+                    columns = [[] for _ in keep]
+                    n_rows = 0
+        
+        if n_rows or not yielded:
+            yield build_chunk(columns)
+    finally:
+        workbook.close()
+
+def iter_data_file_chunks(file_path, chunk_rows, sheet_name=None, roles_only=False):
+    """
+    Read one CSV or Excel file in chunks of rows so it never has to fit in memory at once
+    
+    Legacy .xls workbooks can't be streamed, so they are read whole and then split.
+    
+    Parameters:
+    file_path (str): Path to a CSV or Excel file
+    chunk_rows (int): Rows per chunk
+    sheet_name (str): Excel sheet to read, or None to pick one by its header
+    roles_only (bool): Only read columns used by the column-role detection
+    
+    Yields:
+    pandas.DataFrame: Chunks of rows in file order
+    """
+    if file_path.endswith('.csv'):
+        usecols = None
+        if roles_only:
+            usecols = get_role_columns(pd.read_csv(file_path, nrows=0).columns)
+        yield from pd.read_csv(file_path, usecols=usecols, chunksize=chunk_rows)
+    elif file_path.endswith('.xlsx'):
+        yield from iter_xlsx_chunks(file_path, sheet_name, roles_only, chunk_rows)
+    elif file_path.endswith('.xls'):
+        data = read_data_file(file_path, sheet_name, roles_only)
+        for start in range(0, len(data), chunk_rows):
+            yield data.iloc[start:start + chunk_rows]
+
+def read_data_header(file_path, sheet_name=None, roles_only=False):
+    """
+    Read only the column names of a CSV or Excel file
+    
+    Parameters:
+    file_path (str): Path to a CSV or Excel file
+    sheet_name (str): Excel sheet to read, or None to pick one by its header
+    roles_only (bool): Only keep columns used by the column-role detection
+    
+    Returns:
+    list: Column names, empty for unsupported file types
+    """
+    if file_path.endswith('.csv'):
+        columns = list(pd.read_csv(file_path, nrows=0).columns)
+    elif file_path.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            _, header = read_xlsx_header(workbook, sheet_name)
+        finally:
+            workbook.close()
+        columns = [name for name in header if name]
+    elif file_path.endswith('.xls'):
+        columns = list(read_data_file(file_path, sheet_name).columns)
+    else:
+        return []
+    
+    return get_role_columns(columns) if roles_only else columns
+
+def convert_excel_values(values):
+    """
+    Convert raw Excel cell values to the dtype read_csv would give the same column
+    
+    Dates become 'YYYY-MM-DD' strings (with a time only when one is present), numeric
+    columns become int64/float64, and mixed columns become strings.
+    
+    Parameters:
+    values (list): Cell values of one column
+    
+    Returns:
+    pandas.Series: Converted column
+    """
+    series = pd.Series(values, dtype=object)
+    non_null = series.dropna()
+    
+    if non_null.empty:
+        return series.astype(float)
+    
+    if all(isinstance(value, (datetime.datetime, datetime.date)) for value in non_null):
+        dates = pd.to_datetime(series)
+        date_format = '%Y-%m-%d' if (dates.dropna() == dates.dropna().dt.normalize()).all() else '%Y-%m-%d %H:%M:%S'
+        return pd.Series([value.strftime(date_format) if pd.notna(value) else None for value in dates])
+    
+    if all(isinstance(value, bool) for value in non_null):
+        return series.astype(bool) if len(non_null) == len(series) else series
+    
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in non_null):
+        return pd.to_numeric(series)
+    
+    # Let pandas infer the string dtype so it matches read_csv for the installed version
+    return pd.Series([str(value) if value is not None else None for value in values])
+
+def get_role_columns(columns):
+    """
+    Find the columns the column-role detection and detectors use
+    
+    Parameters:
+    columns (list): Column names
+    
+    Returns:
+    list: Column names in their original order
+    """
+    frame = pd.DataFrame(columns=list(columns))
+    
+    wanted = set(get_date_columns(frame) + get_distress_columns(frame) + get_category_columns(frame) +
+                 get_context_columns(frame))
+    wanted.add(get_section_id_column(frame))
+    wanted.add(get_pci_column(frame))
+    wanted.update(col for col in frame.columns if col.lower() in ('latitude', 'longitude') or 'work' in col.lower())
+    
+    return [col for col in frame.columns if col in wanted]
+
+def select_data_sheet(headers):
+    """
+    Pick the sheet that holds pavement data from each sheet's header row
+    
+    Parameters:
+    headers (dict): {sheet_name: list of header names} in workbook order
+    
+    Returns:
+    str: Name of the sheet with a section ID and PCI column, else one with a section ID, else the first
+    """
+    best_sheet, best_score = next(iter(headers)), -1
+    
+    for sheet, header in headers.items():
+        frame = pd.DataFrame(columns=[name for name in header if name])
+        score = 0
+        if get_section_id_column(frame) in frame.columns:
+            score += 2
+        if get_pci_column(frame):
+            score += 1
+        if score > best_score:
+            best_sheet, best_score = sheet, score
+    
+    return best_sheet
+
 def get_section_id_column(data):
     """
     Determine the section ID column name in the dataset
@@ -114,4 +421,301 @@ def get_category_columns(data):
     
     return [col for col in data.columns if any(
         category in col.lower() for category in category_keywords
-    )]
\ No newline at end of file
+    )]
+
+def get_context_columns(data):
+    """
+    Find the structural and traffic context columns used to explain PCI
+    
+    Parameters:
+    data (pandas.DataFrame): Dataset to analyze
+    
+    Returns:
+    list: Column names for deflection, temperature and traffic volume (in that order) that are present
+    """
+    context_keywords = ['deflection', 'temperature', 'traffic']
+    
+    context_columns = []
+    for keyword in context_keywords:
+        matches = [col for col in data.columns if keyword in col.lower()]
+        if matches:
+            context_columns.append(matches[0])
+    
+    return context_columns
+
+def get_maintenance_type_columns(data):
+    """
+    Find columns describing the maintenance treatment applied
+    
+    Parameters:
+    data (pandas.DataFrame): Maintenance history data
+    
+    Returns:
+    list: List of column names that likely contain treatment types
+    """
+    return [col for col in data.columns if 'type' in col.lower() or 'work' in col.lower()]
+
+def build_section_index(data, section_id_col, prefix):
+    """
+    Reduce a dataset to one row per section with its PCI and parsed survey date
+    
+    The first row of each section is used, matching the detectors' per-section lookups.
+    Dates are parsed value by value, so surveys recorded in different formats all parse.
+    
+    Parameters:
+    data (pandas.DataFrame): Current or historical PMP data
+    section_id_col (str): Name of section ID column
+    prefix (str): Prefix for the output columns, e.g. 'historical'
+    
+    Returns:
+    pandas.DataFrame: Columns section_id_col, '<prefix>_pci' and '<prefix>_date' (NaT where unparseable)
+    """
+    pci_col = get_pci_column(data)
+    date_cols = get_date_columns(data)
+    
+    # Rows without a section ID can't be matched to anything, and merge would pair NaN with NaN
+    first_rows = data.dropna(subset=[section_id_col]).drop_duplicates(subset=section_id_col, keep='first')
+    
+    index = pd.DataFrame({section_id_col: first_rows[section_id_col].to_numpy()})
+    index[f'{prefix}_pci'] = (
+        pd.to_numeric(first_rows[pci_col], errors='coerce').to_numpy() if pci_col else np.nan
+    )
+    index[f'{prefix}_date'] = (
+        pd.to_datetime(first_rows[date_cols[0]], format='mixed', errors='coerce').to_numpy() if date_cols else pd.NaT
+    )
+    return index
+
+def build_maintenance_index(maintenance_data, section_id_col):
+    """
+    Reduce maintenance history to one row per section with its latest treatment
+    
+    Dates are parsed value by value and rows with unparseable dates are ignored.
+    Where several treatments share the latest date, the first one listed is used.
+    
+    Parameters:
+    maintenance_data (pandas.DataFrame): Maintenance history data
+    section_id_col (str): Name of section ID column
+    
+    Returns:
+    pandas.DataFrame: Columns section_id_col, 'latest_maintenance_date' and
+                      'latest_maintenance_type' (None without a treatment type column)
+    """
+    date_cols = get_date_columns(maintenance_data)
+    type_cols = get_maintenance_type_columns(maintenance_data)
+    
+    records = pd.DataFrame({
+        section_id_col: maintenance_data[section_id_col].to_numpy(),
+        'latest_maintenance_date': (
+            pd.to_datetime(maintenance_data[date_cols[0]], format='mixed', errors='coerce').to_numpy()
+            if date_cols else pd.NaT
+        ),
+        'latest_maintenance_type': maintenance_data[type_cols[0]].to_numpy() if type_cols else None
+    }).dropna(subset=['latest_maintenance_date'])
+    
+    latest_rows = records.groupby(section_id_col, sort=False)['latest_maintenance_date'].idxmax()
+    return records.loc[latest_rows].reset_index(drop=True)
+
+def build_pci_pairs(current_data, historical_data, section_id_col=None, historical_index=None):
+    """
+    Pair each section's current and historical PCI and survey dates with a keyed join
+    
+    Parameters:
+    current_data (pandas.DataFrame): Current PMP data
+    historical_data (pandas.DataFrame): Historical PMP data
+    section_id_col (str): Name of section ID column, detected from current_data if None
+    historical_index (pandas.DataFrame): Prebuilt build_section_index(historical_data, section_id_col,
+                                         'historical') result, built here if None
+    
+    Returns:
+    pandas.DataFrame: Columns section_id, current_pci, historical_pci, current_date,
+                      historical_date and years_between for sections in both datasets
+    """
+    section_id_col = section_id_col or get_section_id_column(current_data)
+    
+    with track_stage('build_pci_pairs') as stage:
+        if historical_index is None:
+            historical_index = build_section_index(historical_data, section_id_col, 'historical')
+        pairs = build_section_index(current_data, section_id_col, 'current').merge(
+            historical_index, on=section_id_col, how='inner'
+        )
+        pairs = pairs.rename(columns={section_id_col: 'section_id'})
+        pairs['years_between'] = (pairs['current_date'] - pairs['historical_date']).dt.days / 365.25
+        stage['rows'] = len(pairs)
+    
+    return pairs
+
+@timed_stage('create_minitab_dataset')
+def create_minitab_dataset(current_data, historical_data, maintenance_data):
+    """
+    Create a combined dataset optimized for Minitab analysis
+    
+    Parameters:
+    current_data (pandas.DataFrame): Current PMP data
+    historical_data (pandas.DataFrame): Historical PMP data
+    maintenance_data (pandas.DataFrame): Maintenance history data
+    
+    Returns:
+    pandas.DataFrame: Combined dataset for Minitab
+    """
+    print("Starting to create Minitab dataset")
+    
+    # Start with current data
+    minitab_data = current_data.copy()
+    
+    # Add data source identifier
+    minitab_data['data_source'] = 'current'
+    
+    # Extract section IDs for joining
+    section_id_col = get_section_id_column(current_data)
+    print(f"Using section ID column: {section_id_col}")
+    
+    # Get PCI columns
+    pci_col_current = get_pci_column(current_data)
+    print(f"Using PCI column: {pci_col_current}")
+    
+    # Add columns for Minitab analysis if they don't exist
+    if pci_col_current and pci_col_current in minitab_data.columns:
+        print(f"Adding PCI categories for Minitab analysis")
+        # Create PCI categories for stratified analysis using numpy select instead of pd.cut
+        if 'pci_category' not in minitab_data.columns:
+            try:
+                # Create conditions for each category
+                conditions = [
+                    (minitab_data[pci_col_current] < 25),
+                    (minitab_data[pci_col_current] >= 25) & (minitab_data[pci_col_current] < 50),
+                    (minitab_data[pci_col_current] >= 50) & (minitab_data[pci_col_current] < 75),
+                    (minitab_data[pci_col_current] >= 75)
+                ]
+                choices = ['Poor', 'Fair', 'Good', 'Excellent']
+                minitab_data['pci_category'] = np.select(conditions, choices, default='Unknown')
+                print("PCI categories created successfully")
+            except Exception as e:
+                print(f"Error creating PCI categories: {e}")
+                # If there's an error, skip adding this column
+                pass
+    
+    # Add historical data comparison if available
+    if not historical_data.empty and section_id_col in historical_data.columns:
+        print("Adding historical data comparison")
+        pci_col_historical = get_pci_column(historical_data)
+        
+        if pci_col_historical:
+            try:
+                # Get historical PCI values
+                historical_pci = historical_data[[section_id_col, pci_col_historical]].copy()
+                historical_pci.columns = [section_id_col, 'historical_pci']
+                
+                # Add to minitab data
+                minitab_data = pd.merge(
+                    minitab_data,
+                    historical_pci,
+                    on=section_id_col,
+                    how='left'
+                )
+                
+                # Calculate PCI change
+                if pci_col_current and 'historical_pci' in minitab_data.columns:
+                    minitab_data['pci_change'] = minitab_data[pci_col_current] - minitab_data['historical_pci']
+                    
+                    # Calculate annual rate of change if dates are available
+                    date_cols_current = get_date_columns(current_data)
+                    date_cols_historical = get_date_columns(historical_data)
+                    
+                    if date_cols_current and date_cols_historical:
+                        try:
+                            # Add dates for time-based analysis
+                            current_dates = current_data[[section_id_col, date_cols_current[0]]].copy()
+                            current_dates.columns = [section_id_col, 'current_date']
+                            
+                            historical_dates = historical_data[[section_id_col, date_cols_historical[0]]].copy()
+                            historical_dates.columns = [section_id_col, 'historical_date']
+                            
+                            # Merge dates
+                            minitab_data = pd.merge(minitab_data, current_dates, on=section_id_col, how='left')
+                            minitab_data = pd.merge(minitab_data, historical_dates, on=section_id_col, how='left')
+                            
+                            # Convert to datetime
+                            minitab_data['current_date'] = pd.to_datetime(minitab_data['current_date'])
+                            minitab_data['historical_date'] = pd.to_datetime(minitab_data['historical_date'])
+                            
+                            # Calculate years between measurements
+                            minitab_data['years_between'] = (minitab_data['current_date'] - minitab_data['historical_date']).dt.days / 365.25
+                            
+                            # Calculate annual rate of deterioration
+                            minitab_data['annual_deterioration'] = minitab_data['pci_change'] / minitab_data['years_between']
+                            
+                            print("Historical comparison metrics calculated successfully")
+                        except Exception as e:
+                            print(f"Error calculating date-based metrics: {e}")
+                            # Continue without these metrics if there's an error
+            except Exception as e:
+                print(f"Error processing historical data: {e}")
+    
+    # Add maintenance information if available
+    if not maintenance_data.empty and section_id_col in maintenance_data.columns:
+        print("Adding maintenance information")
+        try:
+            # Flag for sections with maintenance
+            sections_with_maintenance = maintenance_data[section_id_col].unique()
+            minitab_data['has_maintenance'] = minitab_data[section_id_col].isin(sections_with_maintenance)
+            minitab_data['has_maintenance'] = minitab_data['has_maintenance'].astype(int)  # Convert boolean to 0/1 for Minitab
+            
+            # Get maintenance count for each section
+            maintenance_counts = maintenance_data.groupby(section_id_col).size().reset_index(name='maintenance_count')
+            minitab_data = pd.merge(minitab_data, maintenance_counts, on=section_id_col, how='left')
+            minitab_data['maintenance_count'] = minitab_data['maintenance_count'].fillna(0)
+            
+            # Get latest maintenance date and type if available
+            maint_date_cols = get_date_columns(maintenance_data)
+            if maint_date_cols:
+                # Create a dataframe with latest maintenance information
+                # (assign returns a new frame, so cached session data isn't modified)
+                maintenance_data = maintenance_data.assign(maintenance_date=pd.to_datetime(maintenance_data[maint_date_cols[0]]))
+                
+                # Group by section_id and find the latest maintenance date
+                latest_maint_indices = maintenance_data.groupby(section_id_col)['maintenance_date'].idxmax()
+                latest_maintenance = maintenance_data.loc[latest_maint_indices]
+                
+                # Get maintenance type
+                maint_type_cols = [col for col in maintenance_data.columns if 'type' in col.lower() or 'work' in col.lower()]
+                if maint_type_cols:
+                    try:
+                        maint_type_col = maint_type_cols[0]
+                        latest_maintenance_subset = latest_maintenance[[section_id_col, 'maintenance_date', maint_type_col]].copy()
+                        latest_maintenance_subset.columns = [section_id_col, 'latest_maintenance_date', 'latest_maintenance_type']
+                        
+                        # Merge with minitab data
+                        minitab_data = pd.merge(minitab_data, latest_maintenance_subset, on=section_id_col, how='left')
+                        
+                        # Calculate time since last maintenance
+                        if 'current_date' in minitab_data.columns and 'latest_maintenance_date' in minitab_data.columns:
+                            # Convert to datetime again if needed
+                            if not pd.api.types.is_datetime64_dtype(minitab_data['current_date']):
+                                minitab_data['current_date'] = pd.to_datetime(minitab_data['current_date'])
+                            
+                            # Calculate years since maintenance where maintenance data exists
+                            mask = ~minitab_data['latest_maintenance_date'].isna()
+                            if mask.any():
+                                minitab_data.loc[mask, 'years_since_maintenance'] = (
+                                    minitab_data.loc[mask, 'current_date'] - 
+                                    minitab_data.loc[mask, 'latest_maintenance_date']
+                                ).dt.days / 365.25
+                            
+                            print("Maintenance metrics calculated successfully")
+                    except Exception as e:
+                        print(f"Error processing maintenance type information: {e}")
+                        
+        except Exception as e:
+            print(f"Error processing maintenance data for Minitab: {e}")
+    
+    # Clean up any missing values for Minitab compatibility
+    # Convert all object columns containing NaN to string type
+    for col in minitab_data.select_dtypes(include=['object']).columns:
+        minitab_data[col] = minitab_data[col].astype(str)
+        minitab_data[col] = minitab_data[col].replace('nan', '')
+    
+    # Fill numeric NaN values with 0
+    minitab_data = minitab_data.fillna(0)
+    
+    print("Minitab dataset created successfully")
+    return minitab_data
@@ -0,0 +1,241 @@
+import functools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Process-wide counters, rendered by render_prometheus()
+_lock = threading.Lock()
+STAGE_METRICS = {}  # {stage: {'calls', 'seconds', 'rows', 'peak_memory_bytes'}}
+CACHE_METRICS = {}  # {cache: {'hits', 'misses'}}
+STARTUP_METRICS = {}  # {phase: seconds}
+
+# Per-request profile state; only populated between start_profile() and finish_profile()
+_profile = threading.local()
+
+@contextmanager
+def track_stage(name):
+    """
+    Time a pipeline stage and record it in the process-wide metrics
+
+    The yielded dictionary can be updated by the caller, e.g. stage['rows'] = len(df).
+    On exit it also holds 'seconds', and 'peak_memory_bytes' when a profile traces memory.
+
+    Parameters:
+    name (str): Stage name, e.g. 'load_datasets' or 'detector.pci_outliers'
+
+    Yields:
+    dict: Stage record
+    """
+    stage = {'name': name, 'rows': 0}
+    stack = getattr(_profile, 'stack', None)
+    profiling = stack is not None
+    tracing = profiling and tracemalloc.is_tracing()
+
+    if tracing:
+        # Fold the parent's peak so far into its running maximum before resetting
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]['_peak'] = max(stack[-1]['_peak'], peak)
+        tracemalloc.reset_peak()
+        stage['_base'] = current
+        stage['_peak'] = current
+    if profiling:
+        stack.append(stage)
+
+    start_time = time.perf_counter()
+    try:
+        yield stage
+    finally:
+        stage['seconds'] = round(time.perf_counter() - start_time, 6)
+
+        if tracing:
+            peak = max(stage.pop('_peak'), tracemalloc.get_traced_memory()[1])
+            stage['peak_memory_bytes'] = peak - stage.pop('_base')
+            if len(stack) > 1:
+                stack[-2]['_peak'] = max(stack[-2]['_peak'], peak)
+        if profiling:
+            stack.pop()
+            _profile.stages.append(dict(stage))
+
+        with _lock:
+            totals = STAGE_METRICS.setdefault(name, {'calls': 0, 'seconds': 0.0, 'rows': 0, 'peak_memory_bytes': 0})
+            totals['calls'] += 1
+            totals['seconds'] += stage['seconds']
+            totals['rows'] += int(stage.get('rows') or 0)
+            totals['peak_memory_bytes'] = max(totals['peak_memory_bytes'], stage.get('peak_memory_bytes', 0))
+
+def record_cache(name, hit):
+    """
+    Count a cache lookup
+
+    Parameters:
+    name (str): Cache name
+    hit (bool): Whether the lookup was served from the cache
+    """
+    with _lock:
+        totals = CACHE_METRICS.setdefault(name, {'hits': 0, 'misses': 0})
+        totals['hits' if hit else 'misses'] += 1
+
+    stages = getattr(_profile, 'stages', None)
+    if stages is not None:
+        stages.append({'name': f'cache.{name}', 'hit': bool(hit)})
+
+def record_startup(phase, seconds):
+    """
+    Record how long a startup phase took, e.g. importing the app before forking workers
+
+    Parameters:
+    phase (str): Startup phase name
+    seconds (float): Duration in seconds
+    """
+    with _lock:
+        STARTUP_METRICS[phase] = round(seconds, 6)
+
+def start_profile(trace_memory=True):
+    """
+    Start collecting a stage breakdown for the current thread
+
+    Peak memory is measured with tracemalloc, which is process-wide, so concurrent
+    profiled requests can see each other's allocations. Tracing also slows down
+    allocation-heavy stages, so pass trace_memory=False for clean timings.
+
+    Parameters:
+    trace_memory (bool): Whether to record peak memory per stage
+    """
+    _profile.stages = []
+    _profile.stack = []
+    _profile.started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if _profile.started_tracing:
+        tracemalloc.start()
+
+def get_profile():
+    """
+    Get the stages collected so far for the current thread
+
+    Returns:
+    list or None: Stage records, or None if no profile is active
+    """
+    stages = getattr(_profile, 'stages', None)
+    return list(stages) if stages is not None else None
+
+def timed_stage(name):
+    """
+    Decorator form of track_stage that records len() of the return value as rows
+
+    Parameters:
+    name (str): Stage name
+
+    Returns:
+    callable: Decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with track_stage(name) as stage:
+                result = function(*args, **kwargs)
+                stage['rows'] = len(result) if hasattr(result, '__len__') else 0
+            return result
+        return wrapper
+    return decorator
+
+def finish_profile():
+    """
+    Stop collecting and return the stage breakdown for the current thread
+
+    Returns:
+    list: Stage records in completion order
+    """
+    stages = getattr(_profile, 'stages', None) or []
+    if getattr(_profile, 'started_tracing', False):
+        tracemalloc.stop()
+    _profile.stages = None
+    _profile.stack = None
+    _profile.started_tracing = False
+    return stages
+
+def get_max_rss_bytes():
+    """
+    Get the peak resident set size of this process
+
+    Returns:
+    int or None: Peak RSS in bytes, or None if unavailable on this platform
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+def get_rss_bytes():
+    """
+    Get the current resident set size of this process
+
+    Returns:
+    int or None: RSS in bytes, or None if unavailable on this platform
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE')
+
+def render_prometheus():
+    """
+    Render the collected metrics in the Prometheus text exposition format
+
+    Metrics are per process; under a multi-worker server each scrape reports the worker that served it.
+
+    Returns:
+    str: Metrics text
+    """
+    with _lock:
+        stages = {name: dict(totals) for name, totals in STAGE_METRICS.items()}
+        caches = {name: dict(totals) for name, totals in CACHE_METRICS.items()}
+        startup = dict(STARTUP_METRICS)
+
+    lines = []
+
+    def add_metric(metric, metric_type, help_text, label, values):
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {metric_type}')
+        for label_value, value in sorted(values.items()):
+            lines.append(f'{metric}{{{label}="{label_value}"}} {value}')
+
+    add_metric('pavement_stage_calls_total', 'counter', 'Number of times each pipeline stage ran.',
+               'stage', {name: totals['calls'] for name, totals in stages.items()})
+    add_metric('pavement_stage_seconds_total', 'counter', 'Wall time spent in each pipeline stage.',
+               'stage', {name: round(totals['seconds'], 6) for name, totals in stages.items()})
+    add_metric('pavement_stage_rows_total', 'counter', 'Rows processed by each pipeline stage.',
+               'stage', {name: totals['rows'] for name, totals in stages.items()})
+    add_metric('pavement_stage_peak_memory_bytes', 'gauge', 'Largest traced allocation peak seen in profiled runs.',
+               'stage', {name: totals['peak_memory_bytes'] for name, totals in stages.items()})
+    add_metric('pavement_cache_hits_total', 'counter', 'Cache lookups served from the cache.',
+               'cache', {name: totals['hits'] for name, totals in caches.items()})
+    add_metric('pavement_cache_misses_total', 'counter', 'Cache lookups that had to load data.',
+               'cache', {name: totals['misses'] for name, totals in caches.items()})
+
+    add_metric('pavement_startup_seconds', 'gauge', 'Duration of startup phases such as the preloaded app import.',
+               'phase', startup)
+
+    rss = get_rss_bytes()
+    if rss is not None:
+        lines.append('# HELP process_resident_memory_bytes Resident set size of the process.')
+        lines.append('# TYPE process_resident_memory_bytes gauge')
+        lines.append(f'process_resident_memory_bytes {rss}')
+
+    max_rss = get_max_rss_bytes()
+    if max_rss is not None:
+        lines.append('# HELP process_max_resident_memory_bytes Peak resident set size of the process.')
+        lines.append('# TYPE process_max_resident_memory_bytes gauge')
+        lines.append(f'process_max_resident_memory_bytes {max_rss}')
+
+    return '\n'.join(lines) + '\n'
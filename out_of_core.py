@@ -0,0 +1,548 @@
+"""
+Run pavement QA on networks too large to hold in memory
+
+The datasets are streamed twice. A pre-pass sizes them and computes the
+network-wide statistics that detectors can't get from part of the network:
+the PCI quartiles for the IQR outlier bounds and the robust multivariate
+model, fitted on a uniform sample. A partition pass then splits every dataset
+into on-disk shards by a hash of the section ID, so all rows of a section end
+up in the same shard. Shards are analyzed one per worker process, seeded with
+the network-wide statistics, and their anomalies and Minitab rows are merged.
+
+The number of shards and workers is planned so that the workers' estimated
+peak memory stays within --memory-budget; pass --shards to override the plan.
+
+Writes anomalies.csv, minitab.csv and summary.json into the output directory,
+like a batch job.
+
+Example:
+    python out_of_core.py --current state_*.csv --historical history_*.csv \\
+        --maintenance maintenance.csv --output consortium_qa --memory-budget 8GB
+"""
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from data_processor import (load_datasets, create_minitab_dataset, iter_data_file_chunks, read_data_header,
+                            get_section_id_column, get_pci_column, get_context_columns)
+from anomaly_detector import run_detectors, select_detectors, fit_multivariate_model
+from batch import write_atomic, SUMMARY_FILE
+from metrics import track_stage, get_max_rss_bytes
+
+DATA_TYPES = ('current', 'historical', 'maintenance')
+ANOMALY_COLUMNS = ['section_id', 'reason', 'review_type', 'confidence', 'detector']
+SHARDS_SUBFOLDER = 'shards'
+
+# Resident memory of a worker process with pandas and the detectors imported, before loading data
+WORKER_BASE_BYTES = 150 * 1024 ** 2
+# Peak memory of analyzing a shard relative to its loaded DataFrames (detector and Minitab copies)
+WORKING_SET_FACTOR = 4
+# Headroom for hash partitions coming out larger than average
+SHARD_SKEW = 1.25
+
+def parse_memory_size(text):
+    """
+    Parse a memory size such as '512MB', '8GB' or a plain number of bytes
+
+    Parameters:
+    text (str): Size with an optional KB, MB, GB or TB suffix (powers of 1024)
+
+    Returns:
+    int: Size in bytes
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*', str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid memory size '{text}'. Use e.g. 512MB or 8GB")
+    exponent = ' KMGT'.index(match.group(2).upper() or ' ')
+    return int(float(match.group(1)) * 1024 ** exponent)
+
+def get_chunk_rows(memory_budget):
+    """
+    Choose how many rows to read at a time while streaming the input files
+
+    Parameters:
+    memory_budget (int): Memory budget in bytes
+
+    Returns:
+    int: Rows per chunk, assuming up to ~1KB per parsed row and a few copies while splitting it
+    """
+    return int(min(100000, max(1000, memory_budget // 8192)))
+
+def get_shard_numbers(section_ids, n_shards):
+    """
+    Assign rows to shards by a hash of their section ID
+
+    Parameters:
+    section_ids (pandas.Series): Section IDs
+    n_shards (int): Number of shards
+
+    Returns:
+    numpy.ndarray: Shard number of each row
+    """
+    # Hash the text form so an ID read as 1001 in one file, '1001' in another or 1001.0
+    # next to missing values lands in the same shard, where the shard files are re-read together
+    text = section_ids.astype(str)
+    if pd.api.types.is_float_dtype(section_ids):
+        integral = section_ids.notna() & (section_ids == section_ids.round())
+        text[integral] = section_ids[integral].astype('int64').astype(str)
+    return pd.util.hash_pandas_object(text, index=False).to_numpy() % n_shards
+
+def quantile_from_counts(counts, q):
+    """
+    Compute a quantile exactly from value counts, interpolating like pandas.Series.quantile
+
+    Parameters:
+    counts (pandas.Series): Number of occurrences indexed by value
+    q (float): Quantile between 0 and 1
+
+    Returns:
+    float: The quantile, NaN if there are no values
+    """
+    counts = counts[counts > 0].sort_index()
+    n_values = int(counts.sum())
+    if n_values == 0:
+        return np.nan
+
+    cumulative = counts.cumsum().to_numpy()
+    values = counts.index.to_numpy(dtype=float)
+    position = q * (n_values - 1)
+    lower, upper = math.floor(position), math.ceil(position)
+
+    # The value at 0-based rank k is the first one whose cumulative count exceeds k
+    lower_value = values[np.searchsorted(cumulative, lower, side='right')]
+    upper_value = values[np.searchsorted(cumulative, upper, side='right')]
+    return float(np.quantile([lower_value, upper_value], position - lower))
+
+def gather_network_stats(file_paths, pci_col=None, feature_cols=None, chunk_rows=100000,
+                         sheet_name=None, roles_only=False, sample_size=50000, random_state=0):
+    """
+    Stream every dataset once to size it and collect network-wide detector statistics
+
+    Parameters:
+    file_paths (dict): File lists keyed by 'current', 'historical' and 'maintenance'
+    pci_col (str): Current PCI column whose value counts are collected, or None to skip
+    feature_cols (list): Multivariate feature columns (PCI last) to sample, or None to skip
+    chunk_rows (int): Rows read at a time
+    sheet_name (str): Excel sheet to read, or None to pick one by its header
+    roles_only (bool): Only read columns used by the column-role detection
+    sample_size (int): Rows kept in the uniform sample of complete feature rows
+    random_state (int): Seed for the sample
+
+    Returns:
+    dict: 'rows' and 'memory_bytes' per data type, 'pci_counts' (value counts of current PCI)
+          and 'sample' (complete feature rows in file order, all of them if there are few enough)
+    """
+    rng = np.random.default_rng(random_state)
+    stats = {
+        'rows': dict.fromkeys(DATA_TYPES, 0),
+        'memory_bytes': dict.fromkeys(DATA_TYPES, 0),
+        'pci_counts': pd.Series(dtype=float),
+        'sample': None
+    }
+    sample_parts = []
+    sample_rows = 0
+    position = 0
+
+    for data_type in DATA_TYPES:
+        for file_path in file_paths[data_type]:
+            for chunk in iter_data_file_chunks(file_path, chunk_rows, sheet_name, roles_only):
+                stats['rows'][data_type] += len(chunk)
+                stats['memory_bytes'][data_type] += int(chunk.memory_usage(deep=True).sum())
+
+                if data_type != 'current':
+                    continue
+
+                if pci_col and pci_col in chunk.columns:
+                    counts = pd.to_numeric(chunk[pci_col], errors='coerce').value_counts()
+                    stats['pci_counts'] = stats['pci_counts'].add(counts, fill_value=0)
+
+                if feature_cols and all(col in chunk.columns for col in feature_cols):
+                    features = chunk[feature_cols].reset_index(drop=True)
+                    complete = features.apply(pd.to_numeric, errors='coerce').dropna()
+                    complete = complete.assign(_order=position + complete.index, _key=rng.random(len(complete)))
+                    sample_parts.append(complete)
+                    sample_rows += len(complete)
+                    # Keep the rows with the smallest random keys, which is a uniform sample
+                    if sample_rows > 2 * sample_size:
+                        sample_parts = [pd.concat(sample_parts).nsmallest(sample_size, '_key')]
+                        sample_rows = sample_size
+
+                position += len(chunk)
+
+    if sample_parts:
+        sample = pd.concat(sample_parts)
+        if len(sample) > sample_size:
+            sample = sample.nsmallest(sample_size, '_key')
+        stats['sample'] = sample.sort_values('_order').drop(columns=['_order', '_key'])
+
+    return stats
+
+def plan_shards(memory_bytes, memory_budget, workers, shards=None):
+    """
+    Choose the number of shards and worker processes for a memory budget
+
+    The budget covers the main process and all workers, each of which holds one shard at a time.
+
+    Parameters:
+    memory_bytes (int): In-memory size of all datasets measured by the pre-pass
+    memory_budget (int): Memory budget in bytes
+    workers (int): Maximum number of worker processes
+    shards (int): Number of shards to use instead of the planned number
+
+    Returns:
+    dict: 'shards', 'workers', 'worker_budget_bytes' (for one shard's data) and 'shard_estimate_bytes'
+    """
+    available = memory_budget - WORKER_BASE_BYTES
+    # Fewer workers than CPUs when the budget can't give each one at least its base size again for data
+    workers = max(1, min(workers, int(available // (2 * WORKER_BASE_BYTES))))
+    worker_budget = available / workers - WORKER_BASE_BYTES
+    if worker_budget <= 0:
+        raise ValueError(
+            f"A memory budget of {memory_budget / 1024 ** 2:.0f}MB is too small; the main process and each "
+            f"worker need about {WORKER_BASE_BYTES / 1024 ** 2:.0f}MB before loading any data"
+        )
+
+    needed = math.ceil(memory_bytes * WORKING_SET_FACTOR * SHARD_SKEW / worker_budget)
+    n_shards = shards or max(needed, workers, 1)
+    if n_shards < needed:
+        print(f"Warning: {n_shards} shards are expected to exceed the memory budget; about {needed} are needed")
+
+    return {
+        'shards': n_shards,
+        'workers': min(workers, n_shards),
+        'worker_budget_bytes': int(worker_budget),
+        'shard_estimate_bytes': int(memory_bytes * WORKING_SET_FACTOR / n_shards)
+    }
+
+def partition_datasets(file_paths, shard_root, n_shards, section_id_col, chunk_rows=100000,
+                       sheet_name=None, roles_only=False):
+    """
+    Stream every dataset into per-shard CSV files by a hash of the section ID
+
+    Rows keep their file order within a shard, so first-row-per-section lookups are unchanged.
+
+    Parameters:
+    file_paths (dict): File lists keyed by 'current', 'historical' and 'maintenance'
+    shard_root (str): Directory the shard directories are created in
+    n_shards (int): Number of shards
+    section_id_col (str): Name of section ID column
+    chunk_rows (int): Rows read at a time
+    sheet_name (str): Excel sheet to read, or None to pick one by its header
+    roles_only (bool): Only read columns used by the column-role detection
+
+    Returns:
+    list: Shards as dictionaries with 'number', 'dir' and a 'files' list per data type
+    """
+    shards = []
+    for number in range(n_shards):
+        shard_dir = os.path.join(shard_root, f'shard_{number:04d}')
+        os.makedirs(shard_dir)
+        shards.append({'number': number, 'dir': shard_dir, 'files': {data_type: [] for data_type in DATA_TYPES}})
+
+    for data_type in DATA_TYPES:
+        for file_number, file_path in enumerate(file_paths[data_type]):
+            # Each input file gets its own shard file so load_datasets combines them per shard as it would whole
+            shard_file = f'{data_type}_{file_number}.csv'
+            written = set()
+
+            for chunk in iter_data_file_chunks(file_path, chunk_rows, sheet_name, roles_only):
+                if section_id_col not in chunk.columns:
+                    print(f"Skipping {file_path}: no '{section_id_col}' column to partition by")
+                    break
+
+                shard_numbers = get_shard_numbers(chunk[section_id_col], n_shards)
+                for number, rows in chunk.groupby(shard_numbers, sort=False):
+                    path = os.path.join(shards[number]['dir'], shard_file)
+                    rows.to_csv(path, mode='a', header=number not in written, index=False)
+                    if number not in written:
+                        written.add(number)
+                        shards[number]['files'][data_type].append(path)
+
+    return shards
+
+def run_shard(shard, shared, detectors=None, max_cost=None):
+    """
+    Analyze one shard in a worker process and write its outputs next to its data
+
+    Parameters:
+    shard (dict): Shard from partition_datasets
+    shared (dict): Network-wide statistics to seed run_detectors' shared results with
+    detectors (list): Detector names to run, or None for all
+    max_cost (str): Most expensive detector cost class to run, or None for all
+
+    Returns:
+    dict: Shard summary with row counts, detector statistics and the worker's peak RSS
+    """
+    start_time = time.perf_counter()
+    datasets = {
+        data_type: load_datasets(shard['files'][data_type], max_workers=1)
+        for data_type in DATA_TYPES
+    }
+    current_data = datasets['current']
+
+    result = {
+        'number': shard['number'],
+        'rows': {data_type: len(data) for data_type, data in datasets.items()},
+        'anomalies': 0,
+        'detector_stats': []
+    }
+
+    # Sections that only appear in historical or maintenance data aren't analyzed
+    if not current_data.empty:
+        anomalies, detector_stats = run_detectors(
+            current_data, datasets['historical'], datasets['maintenance'], detectors, max_cost, dict(shared)
+        )
+        pd.DataFrame(anomalies, columns=ANOMALY_COLUMNS).to_csv(
+            os.path.join(shard['dir'], 'anomalies.csv'), index=False
+        )
+
+        minitab_data = create_minitab_dataset(current_data, datasets['historical'], datasets['maintenance'])
+        minitab_data.to_csv(os.path.join(shard['dir'], 'minitab.csv'), index=False)
+
+        result['anomalies'] = len(anomalies)
+        result['detector_stats'] = detector_stats
+
+    result['pid'] = os.getpid()
+    result['max_rss_bytes'] = get_max_rss_bytes()
+    result['seconds'] = round(time.perf_counter() - start_time, 3)
+    return result
+
+def merge_shard_outputs(shards, filename, output_path, chunk_rows=100000):
+    """
+    Concatenate a CSV output of every shard into one file
+
+    Shards whose columns match are copied as text; others are aligned to the union of
+    columns, with 0 for columns a shard lacks as create_minitab_dataset fills missing values.
+
+    Parameters:
+    shards (list): Shards from partition_datasets
+    filename (str): Output file name in each shard directory
+    output_path (str): Merged file path
+    chunk_rows (int): Rows re-read at a time from shards that need aligning
+
+    Returns:
+    int: Number of shard files merged
+    """
+    paths = [os.path.join(shard['dir'], filename) for shard in shards]
+    paths = [path for path in paths if os.path.exists(path)]
+
+    columns = []
+    headers = {}
+    for path in paths:
+        headers[path] = list(pd.read_csv(path, nrows=0).columns)
+        columns.extend(col for col in headers[path] if col not in columns)
+
+    def write(temp_path):
+        with open(temp_path, 'w', newline='') as output:
+            pd.DataFrame(columns=columns).to_csv(output, index=False)
+            for path in paths:
+                if headers[path] == columns:
+                    with open(path, newline='') as shard_file:
+                        shard_file.readline()
+                        shutil.copyfileobj(shard_file, output)
+                else:
+                    for chunk in pd.read_csv(path, chunksize=chunk_rows):
+                        chunk.reindex(columns=columns, fill_value=0).to_csv(output, header=False, index=False)
+
+    write_atomic(output_path, write)
+    return len(paths)
+
+def combine_detector_stats(shard_results):
+    """
+    Combine per-shard detector statistics into one entry per detector
+
+    Parameters:
+    shard_results (list): Results of run_shard
+
+    Returns:
+    list: Detector statistics like run_detectors', 'ran' if the detector ran on any shard
+    """
+    combined = {}
+    for result in shard_results:
+        for stats in result['detector_stats']:
+            total = combined.setdefault(stats['name'], {**stats, 'status': 'skipped', 'seconds': 0.0,
+                                                        'rows': 0, 'anomalies': 0})
+            if stats['status'] == 'ran':
+                total['status'] = 'ran'
+                total['missing_roles'] = []
+            total['seconds'] = round(total['seconds'] + stats['seconds'], 6)
+            total['rows'] += stats['rows']
+            total['anomalies'] += stats['anomalies']
+    return list(combined.values())
+
+def run_out_of_core(file_paths, output_dir, memory_budget, workers=None, shards=None, detectors=None,
+                    max_cost=None, sheet_name=None, roles_only=False, keep_shards=False):
+    """
+    Analyze datasets shard by shard within a memory budget and merge the outputs
+
+    Parameters:
+    file_paths (dict): File lists keyed by 'current', 'historical' and 'maintenance'
+    output_dir (str): Output directory
+    memory_budget (int): Memory budget in bytes for the main process and all workers
+    workers (int): Maximum number of worker processes, defaults to the number of CPUs
+    shards (int): Number of shards to use instead of the planned number
+    detectors (list): Detector names to run, or None for all
+    max_cost (str): Most expensive detector cost class to run, or None for all
+    sheet_name (str): Excel sheet to read, or None to pick one by its header
+    roles_only (bool): Only read columns used by the detectors
+    keep_shards (bool): Keep the shard directories after merging
+
+    Returns:
+    dict: Run summary, also written to summary.json
+    """
+    start_time = time.perf_counter()
+    selected = select_detectors(detectors, max_cost)
+
+    columns = []
+    for file_path in file_paths['current']:
+        columns.extend(col for col in read_data_header(file_path, sheet_name, roles_only) if col not in columns)
+    if not columns:
+        raise ValueError('No current data found')
+
+    header = pd.DataFrame(columns=columns)
+    section_id_col = get_section_id_column(header)
+    pci_col = get_pci_column(header)
+    context_cols = get_context_columns(header)
+    feature_cols = context_cols + [pci_col] if pci_col and context_cols and 'multivariate' in selected else None
+
+    chunk_rows = get_chunk_rows(memory_budget)
+    with track_stage('out_of_core.prepass') as stage:
+        stats = gather_network_stats(
+            file_paths, pci_col if 'pci_outliers' in selected else None, feature_cols,
+            chunk_rows, sheet_name, roles_only
+        )
+        stage['rows'] = sum(stats['rows'].values())
+
+    if not stats['rows']['current']:
+        raise ValueError('No current data found')
+
+    # Network-wide statistics that a single shard would get wrong
+    shared = {}
+    if not stats['pci_counts'].empty:
+        shared['pci_quartiles'] = (
+            quantile_from_counts(stats['pci_counts'], 0.25),
+            quantile_from_counts(stats['pci_counts'], 0.75)
+        )
+    if stats['sample'] is not None:
+        model = fit_multivariate_model(stats['sample'], feature_cols)
+        if model is not None:
+            shared['multivariate_model'] = model
+
+    plan = plan_shards(sum(stats['memory_bytes'].values()), memory_budget, workers or os.cpu_count() or 1, shards)
+    print(f"Analyzing {stats['rows']['current']:,} sections in {plan['shards']} shards on {plan['workers']} workers")
+
+    os.makedirs(output_dir, exist_ok=True)
+    shard_root = os.path.join(output_dir, SHARDS_SUBFOLDER)
+    # Shard files are appended to, so never reuse ones left by an interrupted run
+    shutil.rmtree(shard_root, ignore_errors=True)
+
+    try:
+        with track_stage('out_of_core.partition') as stage:
+            shard_list = partition_datasets(
+                file_paths, shard_root, plan['shards'], section_id_col, chunk_rows, sheet_name, roles_only
+            )
+            stage['rows'] = sum(stats['rows'].values())
+
+        shard_results = []
+        with track_stage('out_of_core.shards') as stage:
+            if plan['workers'] == 1:
+                for shard in shard_list:
+                    shard_results.append(run_shard(shard, shared, detectors, max_cost))
+            else:
+                with ProcessPoolExecutor(max_workers=plan['workers']) as executor:
+                    futures = [executor.submit(run_shard, shard, shared, detectors, max_cost) for shard in shard_list]
+                    for future in as_completed(futures):
+                        shard_results.append(future.result())
+                        print(f"[{len(shard_results)}/{len(shard_list)}] shards done")
+            stage['rows'] = stats['rows']['current']
+
+        shard_results.sort(key=lambda result: result['number'])
+
+        with track_stage('out_of_core.merge'):
+            merge_shard_outputs(shard_list, 'anomalies.csv', os.path.join(output_dir, 'anomalies.csv'), chunk_rows)
+            merge_shard_outputs(shard_list, 'minitab.csv', os.path.join(output_dir, 'minitab.csv'), chunk_rows)
+    finally:
+        if not keep_shards:
+            shutil.rmtree(shard_root, ignore_errors=True)
+
+    # ru_maxrss is per process, so the peak of each worker is the largest value it reported
+    worker_peaks = {}
+    for result in shard_results:
+        worker_peaks[result['pid']] = max(worker_peaks.get(result['pid'], 0), result['max_rss_bytes'] or 0)
+    max_worker_rss = max(worker_peaks.values(), default=0)
+
+    anomalies_count = sum(result['anomalies'] for result in shard_results)
+    total_sections = stats['rows']['current']
+    summary = {
+        'total_sections': total_sections,
+        'anomalies_count': anomalies_count,
+        'review_percentage': round(anomalies_count / total_sections * 100, 2),
+        'detector_stats': combine_detector_stats(shard_results),
+        'memory_budget_bytes': memory_budget,
+        'plan': plan,
+        'max_worker_rss_bytes': max_worker_rss,
+        'shards': [{key: result[key] for key in ('number', 'rows', 'anomalies', 'seconds')} for result in shard_results],
+        'seconds': round(time.perf_counter() - start_time, 3)
+    }
+
+    if max_worker_rss > plan['worker_budget_bytes'] + WORKER_BASE_BYTES:
+        print(f"Warning: a worker peaked at {max_worker_rss / 1024 ** 2:.0f}MB, above its "
+              f"{(plan['worker_budget_bytes'] + WORKER_BASE_BYTES) / 1024 ** 2:.0f}MB share of the budget. "
+              f"Rerun with more --shards")
+
+    def write_summary(path):
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=2, default=str)
+
+    write_atomic(os.path.join(output_dir, SUMMARY_FILE), write_summary)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run pavement QA/QC shard by shard within a memory budget')
+    parser.add_argument('--current', nargs='+', required=True, help='Current data files')
+    parser.add_argument('--historical', nargs='*', default=[], help='Historical data files')
+    parser.add_argument('--maintenance', nargs='*', default=[], help='Maintenance history files')
+    parser.add_argument('--output', default='qa_results', help='Output directory')
+    parser.add_argument('--memory-budget', default='4GB',
+                        help='Memory for the main process and all workers together, e.g. 512MB or 16GB')
+    parser.add_argument('--workers', type=int, help='Maximum worker processes (default: number of CPUs)')
+    parser.add_argument('--shards', type=int, help='Number of shards (default: planned from the memory budget)')
+    parser.add_argument('--detectors', nargs='+', help='Detector names to run (default: all)')
+    parser.add_argument('--max-cost', choices=['fast', 'moderate', 'slow'],
+                        help='Most expensive detector cost class to run')
+    parser.add_argument('--sheet', help='Excel sheet to read from every workbook')
+    parser.add_argument('--roles-only', action='store_true',
+                        help='Only load columns the detectors use (Minitab exports then omit other columns)')
+    parser.add_argument('--keep-shards', action='store_true', help='Keep the shard files after merging')
+    args = parser.parse_args(argv)
+
+    try:
+        memory_budget = parse_memory_size(args.memory_budget)
+    except ValueError as e:
+        parser.error(str(e))
+
+    file_paths = {'current': args.current, 'historical': args.historical, 'maintenance': args.maintenance}
+    try:
+        summary = run_out_of_core(
+            file_paths, args.output, memory_budget, args.workers, args.shards,
+            args.detectors, args.max_cost, args.sheet, args.roles_only, args.keep_shards
+        )
+    except ValueError as e:
+        # Budgets too small to plan shards for, unknown detectors and missing current data
+        parser.error(str(e))
+
+    print(f"{summary['anomalies_count']} anomalies in {summary['total_sections']:,} sections "
+          f"({summary['seconds']}s, worker peak RSS {summary['max_worker_rss_bytes'] / 1024 ** 2:.0f}MB)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
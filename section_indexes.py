@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+from data_processor import build_section_index, build_maintenance_index
+from metrics import track_stage, record_cache
+
+# Bump when a builder's output changes so indexes persisted by older code are rebuilt
+INDEX_VERSION = 4
+
+INDEX_BUILDERS = {
+    'historical': lambda data, section_id_col: build_section_index(data, section_id_col, 'historical'),
+    'maintenance': build_maintenance_index
+}
+
+# File digests keyed by (path, size, mtime) so unchanged files are only hashed once per process
+_digests = {}
+_digest_lock = threading.Lock()
+
+def hash_file(file_path, block_size=1024 * 1024):
+    """
+    Get the SHA-256 digest of a file's contents
+
+    Parameters:
+    file_path (str): File path
+    block_size (int): Bytes read at a time
+
+    Returns:
+    str: Hex digest
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+    with _digest_lock:
+        if key in _digests:
+            return _digests[key]
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+
+    with _digest_lock:
+        _digests[key] = digest.hexdigest()
+    return _digests[key]
+
+def get_index_key(kind, file_digests, section_id_col, load_options=None):
+    """
+    Build the key a section index is stored under
+
+    Parameters:
+    kind (str): 'historical' or 'maintenance'
+    file_digests (list): hash_file digests of the source files, in the order they were loaded
+    section_id_col (str): Name of section ID column
+    load_options (dict): load_datasets options that change what is read, e.g. the sheet name
+
+    Returns:
+    str: Hex key that changes whenever the source contents, their order or the options change
+    """
+    parts = [f'v{INDEX_VERSION}', kind, section_id_col, json.dumps(load_options or {}, sort_keys=True)]
+    parts.extend(file_digests)
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+def get_section_index(index_folder, kind, data, file_digests, section_id_col, load_options=None):
+    """
+    Load a persisted section index, building and persisting it if its source files are new
+
+    Parameters:
+    index_folder (str): Folder holding persisted indexes
+    kind (str): 'historical' or 'maintenance'
+    data (pandas.DataFrame): The dataset loaded from the hashed files, used when the index must be built
+    file_digests (list): hash_file digests of data's source files
+    section_id_col (str): Name of section ID column
+    load_options (dict): load_datasets options used to load data
+
+    Returns:
+    pandas.DataFrame: The index
+    """
+    key = get_index_key(kind, file_digests, section_id_col, load_options)
+    index_path = os.path.join(index_folder, f'{kind}_{key}.pkl')
+
+    if os.path.exists(index_path):
+        try:
+            with track_stage(f'load_index.{kind}') as stage:
+                index = pd.read_pickle(index_path)
+                stage['rows'] = len(index)
+            # The modification time is the index's last use, see remove_idle_indexes
+            os.utime(index_path)
+            record_cache('section_index', True)
+            return index
+        except FileNotFoundError:
+            # Removed by remove_idle_indexes since the check, so build it again
+            pass
+
+    record_cache('section_index', False)
+    with track_stage(f'build_index.{kind}') as stage:
+        index = INDEX_BUILDERS[kind](data, section_id_col)
+        stage['rows'] = len(index)
+
+    # Write under a unique name first so concurrent workers never read a partial index
+    os.makedirs(index_folder, exist_ok=True)
+    temp_path = f'{index_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    index.to_pickle(temp_path)
+    os.replace(temp_path, index_path)
+    return index
+
+def make_index_loader(index_folder, file_paths, load_options=None, file_digests=None):
+    """
+    Make the shared['load_index'] callable run_detectors uses to get persisted indexes
+
+    Indexes are only hashed, loaded or built when a selected detector first needs one.
+
+    Parameters:
+    index_folder (str): Folder holding persisted indexes
+    file_paths (dict): Source file lists keyed by 'historical' and 'maintenance'
+    load_options (dict): load_datasets options used to load the datasets
+    file_digests (dict): Digests of those files taken before they were loaded, e.g. by the
+                         session cache; the files are hashed on first use if None
+
+    Returns:
+    callable: load_index(kind, data, section_id_col) returning the index for kind
+    """
+    def load_index(kind, data, section_id_col):
+        try:
+            digests = file_digests[kind] if file_digests else [hash_file(path) for path in file_paths.get(kind, [])]
+        except OSError:
+            # load_datasets skips files it can't read, so the index can't be keyed by them either
+            digests = None
+        if not digests:
+            return INDEX_BUILDERS[kind](data, section_id_col)
+        return get_section_index(index_folder, kind, data, digests, section_id_col, load_options)
+
+    return load_index
+
+def remove_idle_indexes(index_folder, ttl_seconds):
+    """
+    Delete persisted indexes that haven't been used for a while
+
+    Parameters:
+    index_folder (str): Folder holding persisted indexes
+    ttl_seconds (float): Seconds since an index's last use after which it is removed
+
+    Returns:
+    int: Number of removed indexes
+    """
+    if not os.path.isdir(index_folder):
+        return 0
+
+    now = time.time()
+    removed = 0
+    for name in os.listdir(index_folder):
+        if not name.endswith('.pkl'):
+            continue
+        index_path = os.path.join(index_folder, name)
+        try:
+            if now - os.path.getmtime(index_path) > ttl_seconds:
+                os.remove(index_path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
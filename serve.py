@@ -0,0 +1,114 @@
+"""
+Production server for the pavement QA/QC app
+
+The app is imported once in the master process and workers are forked from it,
+so pandas/NumPy pages are shared copy-on-write between workers. matplotlib and
+seaborn are only imported when a plot is first requested, unless
+--preload-plotting is given.
+
+Examples:
+    python serve.py --workers 8 --threads 4
+    PAVEMENT_WORKERS=8 PAVEMENT_THREADS=4 python serve.py --port 8000
+
+Uses gunicorn where available (Linux/macOS) and falls back to waitress, which
+serves from a single process with a thread pool.
+"""
+import argparse
+import os
+import sys
+import time
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the pavement QA/QC app with a production WSGI server')
+    parser.add_argument('--host', default=os.environ.get('PAVEMENT_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PAVEMENT_PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('PAVEMENT_WORKERS', os.cpu_count() or 1)),
+                        help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('PAVEMENT_THREADS', 2)),
+                        help='Request threads per worker')
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('PAVEMENT_TIMEOUT', 300)),
+                        help='Seconds before a busy worker is restarted; large analyses need several minutes')
+    parser.add_argument('--max-requests', type=int, default=int(os.environ.get('PAVEMENT_MAX_REQUESTS', 0)),
+                        help='Restart each worker after this many requests to bound memory growth (0 disables)')
+    parser.add_argument('--preload-plotting', action='store_true',
+                        help='Import matplotlib and seaborn before forking so workers share them')
+    return parser.parse_args(argv)
+
+def load_app(preload_plotting=False):
+    """
+    Import the Flask app and record how long it took
+
+    Parameters:
+    preload_plotting (bool): Also import the plotting libraries now
+
+    Returns:
+    flask.Flask: The app
+    """
+    load_start = time.perf_counter()
+    start_time = load_start
+    from app import app
+    from metrics import record_startup, get_rss_bytes
+    record_startup('app_import', time.perf_counter() - start_time)
+
+    if preload_plotting:
+        from anomaly_detector import get_plotting_modules
+        start_time = time.perf_counter()
+        get_plotting_modules()
+        record_startup('plotting_import', time.perf_counter() - start_time)
+
+    rss = get_rss_bytes()
+    print(f"App loaded in {time.perf_counter() - load_start:.2f}s" +
+          (f", RSS {rss / 1e6:.1f}MB" if rss else ''))
+    return app
+
+def log_worker_memory(server, worker):
+    # gunicorn post_fork hook: report each worker's starting memory
+    from metrics import get_rss_bytes
+    rss = get_rss_bytes()
+    server.log.info(f"Worker {worker.pid} started" + (f", RSS {rss / 1e6:.1f}MB" if rss else ''))
+
+def run_gunicorn(app, args):
+    from gunicorn.app.base import BaseApplication
+
+    class PavementApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{args.host}:{args.port}')
+            self.cfg.set('workers', args.workers)
+            self.cfg.set('threads', args.threads)
+            self.cfg.set('worker_class', 'gthread' if args.threads > 1 else 'sync')
+            self.cfg.set('timeout', args.timeout)
+            self.cfg.set('max_requests', args.max_requests)
+            self.cfg.set('max_requests_jitter', args.max_requests // 10)
+            self.cfg.set('preload_app', True)
+            self.cfg.set('post_fork', log_worker_memory)
+
+        def load(self):
+            return app
+
+    PavementApplication().run()
+
+def run_waitress(app, args):
+    from waitress import serve
+    print(f"gunicorn is not available; serving with waitress on {args.threads} threads in one process")
+    serve(app, host=args.host, port=args.port, threads=args.threads)
+
+def main(argv=None):
+    args = parse_args(argv)
+    app = load_app(args.preload_plotting)
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        try:
+            import waitress  # noqa: F401
+        except ImportError:
+            print("No production WSGI server installed. Run 'pip install gunicorn' (or 'pip install waitress' on Windows)")
+            return 1
+        run_waitress(app, args)
+        return 0
+
+    run_gunicorn(app, args)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from data_processor import load_datasets
+from metrics import record_cache
+from section_indexes import hash_file
+
+DATA_TYPES = ('current', 'historical', 'maintenance')
+SESSIONS_SUBFOLDER = 'sessions'
+MANIFEST_FILE = 'manifest.json'
+
+# Loaded datasets per session: {session_id: {'files', 'digests', 'loaded_at', 'datasets'}}, least recently used first
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_manifest_lock = threading.Lock()
+
+def get_session_folder(upload_folder, session_id):
+    """
+    Get the folder holding a session's uploads
+
+    Parameters:
+    upload_folder (str): App upload folder
+    session_id (str): Session ID
+
+    Returns:
+    str: Session folder path
+    """
+    # Session IDs end up in file paths, so only accept the IDs create_session hands out
+    if not isinstance(session_id, str) or not re.fullmatch(r'[0-9a-f]{32}', session_id):
+        raise ValueError('Invalid session ID')
+    return os.path.join(upload_folder, SESSIONS_SUBFOLDER, session_id)
+
+def create_session(upload_folder, ttl_seconds=None):
+    """
+    Create an empty dataset session
+
+    Parameters:
+    upload_folder (str): App upload folder
+    ttl_seconds (float): If given, first remove sessions idle for longer than this
+
+    Returns:
+    str: New session ID
+    """
+    if ttl_seconds is not None:
+        remove_idle_sessions(upload_folder, ttl_seconds)
+
+    session_id = uuid.uuid4().hex
+    session_folder = get_session_folder(upload_folder, session_id)
+    os.makedirs(session_folder)
+
+    write_manifest(session_folder, {
+        'session_id': session_id,
+        'created': time.time(),
+        'version': 0,
+        'files': {data_type: [] for data_type in DATA_TYPES}
+    })
+    return session_id
+
+def read_manifest(upload_folder, session_id):
+    """
+    Read a session manifest
+
+    Parameters:
+    upload_folder (str): App upload folder
+    session_id (str): Session ID
+
+    Returns:
+    dict: Manifest with 'session_id', 'created', 'version' and 'files' keys
+    """
+    manifest_path = os.path.join(get_session_folder(upload_folder, session_id), MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise KeyError(f'Session {session_id} not found')
+
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def write_manifest(session_folder, manifest):
+    temp_path = os.path.join(session_folder, f'{MANIFEST_FILE}.tmp')
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, os.path.join(session_folder, MANIFEST_FILE))
+
+def add_session_files(upload_folder, session_id, data_type, file_paths):
+    """
+    Record uploaded files in a session manifest
+
+    Parameters:
+    upload_folder (str): App upload folder
+    session_id (str): Session ID
+    data_type (str): 'current', 'historical' or 'maintenance'
+    file_paths (list): Paths of files saved into the session folder
+
+    Returns:
+    dict: Updated manifest
+    """
+    if data_type not in DATA_TYPES:
+        raise ValueError(f"Unknown data type '{data_type}'. Expected one of {DATA_TYPES}")
+
+    with _manifest_lock:
+        manifest = read_manifest(upload_folder, session_id)
+        files = manifest['files'][data_type]
+        for file_path in file_paths:
+            if file_path not in files:
+                files.append(file_path)
+        manifest['version'] += 1
+        write_manifest(get_session_folder(upload_folder, session_id), manifest)
+
+    return manifest
+
+def load_session(upload_folder, session_id, max_sessions=8, ttl_seconds=1800):
+    """
+    Get a session's datasets together with the source files they were loaded from, loading them once
+
+    Cached frames are keyed by the SHA-256 digests of their files, so a file re-uploaded
+    under the same name is reloaded.
+
+    Parameters:
+    upload_folder (str): App upload folder
+    session_id (str): Session ID
+    max_sessions (int): Maximum number of sessions kept in memory
+    ttl_seconds (float): Seconds after which an unused cached session is evicted
+
+    Returns:
+    dict: 'datasets' (DataFrames keyed by 'current', 'historical' and 'maintenance'),
+          'files' (file lists keyed the same way) and 'digests' (their files' digests).
+          Callers must not modify the DataFrames in place since they are shared between requests.
+    """
+    manifest = read_manifest(upload_folder, session_id)
+    now = time.monotonic()
+    # The manifest's modification time is the session's last use, see remove_idle_sessions
+    os.utime(os.path.join(get_session_folder(upload_folder, session_id), MANIFEST_FILE))
+
+    files = manifest['files']
+    # Hash before loading so a file replaced mid-request can't be cached under its new digest
+    digests = {data_type: [hash_file(file_path) for file_path in files[data_type]] for data_type in DATA_TYPES}
+
+    with _cache_lock:
+        evict_expired(now, ttl_seconds)
+        entry = _cache.get(session_id)
+        if entry and entry['digests'] == digests:
+            entry['loaded_at'] = now
+            _cache.move_to_end(session_id)
+            record_cache('session', True)
+            return entry
+
+    record_cache('session', False)
+    # Only reload data types whose files changed, e.g. a new current survey against the same history
+    datasets = {
+        data_type: (
+            entry['datasets'][data_type]
+            if entry and entry['digests'][data_type] == digests[data_type]
+            else load_datasets(files[data_type])
+        )
+        for data_type in DATA_TYPES
+    }
+
+    entry = {
+        'files': files,
+        'digests': digests,
+        'loaded_at': now,
+        'datasets': datasets
+    }
+    with _cache_lock:
+        _cache[session_id] = entry
+        _cache.move_to_end(session_id)
+        while len(_cache) > max_sessions:
+            _cache.popitem(last=False)
+
+    return entry
+
+def evict_expired(now, ttl_seconds):
+    # Caller holds _cache_lock; entries are in least recently used order
+    while _cache:
+        session_id, entry = next(iter(_cache.items()))
+        if now - entry['loaded_at'] <= ttl_seconds:
+            break
+        _cache.popitem(last=False)
+
+def remove_idle_sessions(upload_folder, ttl_seconds):
+    """
+    Delete the folders of sessions that haven't been uploaded to or analyzed for a while
+
+    Parameters:
+    upload_folder (str): App upload folder
+    ttl_seconds (float): Seconds since a session's last use after which it is removed
+
+    Returns:
+    list: IDs of removed sessions
+    """
+    sessions_folder = os.path.join(upload_folder, SESSIONS_SUBFOLDER)
+    if not os.path.isdir(sessions_folder):
+        return []
+
+    now = time.time()
+    removed = []
+    for session_id in os.listdir(sessions_folder):
+        if not re.fullmatch(r'[0-9a-f]{32}', session_id):
+            continue
+        session_folder = os.path.join(sessions_folder, session_id)
+        manifest_path = os.path.join(session_folder, MANIFEST_FILE)
+        try:
+            last_used = os.path.getmtime(manifest_path if os.path.exists(manifest_path) else session_folder)
+        except OSError:
+            continue
+        if now - last_used > ttl_seconds:
+            shutil.rmtree(session_folder, ignore_errors=True)
+            removed.append(session_id)
+
+    with _cache_lock:
+        for session_id in removed:
+            _cache.pop(session_id, None)
+
+    return removed
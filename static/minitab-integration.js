@@ -229,7 +229,8 @@ document.addEventListener('DOMContentLoaded', function() {
         window.pavementApp.showLoading();
         
         try {
-            const response = await fetch('/api/export-for-minitab', {
+            const sessionId = window.pavementApp.getSessionId();
+            const response = await fetch(`/api/export-for-minitab?session_id=${encodeURIComponent(sessionId || '')}`, {
                 method: 'GET'
             });
             
@@ -77,7 +77,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 alert('Starting simple server export...');
                 
                 // Send request to server
-                fetch('/api/export-for-minitab', {
+                const sessionId = window.pavementApp ? window.pavementApp.getSessionId() : null;
+                fetch(`/api/export-for-minitab?session_id=${encodeURIComponent(sessionId || '')}`, {
                     method: 'GET'
                 })
                 .then(response => {
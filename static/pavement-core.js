@@ -143,6 +143,9 @@ document.addEventListener('DOMContentLoaded', function() {
             }
             
             try {
+                // Each analysis gets its own dataset session on the server
+                sessionId = null;
+                
                 // First, upload all files
                 const currentDataPaths = await uploadFiles(currentFiles, 'current');
                 
@@ -156,9 +159,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 
                 // Then, analyze the data
                 const analysisData = {
-                    current_data_paths: currentDataPaths,
-                    historical_data_paths: historicalDataPaths,
-                    maintenance_data_paths: maintenanceDataPaths
+                    session_id: sessionId
                 };
                 
                 const response = await fetch('/api/analyze', {
@@ -187,12 +188,18 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    // Server-side dataset session holding this analysis' uploads
+    let sessionId = null;
+    
     async function uploadFiles(files, fileType) {
         const formData = new FormData();
         for (let i = 0; i < files.length; i++) {
             formData.append('file', files[i]);
         }
         formData.append('fileTypes', fileType);
+        if (sessionId) {
+            formData.append('session_id', sessionId);
+        }
         
         const response = await fetch('/api/upload', {
             method: 'POST',
@@ -205,6 +212,7 @@ document.addEventListener('DOMContentLoaded', function() {
             throw new Error(result.error || 'Failed to upload files');
         }
         
+        sessionId = result.session_id;
         return result.file_paths;
     }
     
@@ -235,6 +243,12 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     function exportAnomalies() {
+        // Uploaded sessions keep their full results on the server, so stream the export from there
+        if (sessionId) {
+            exportAnomaliesFromServer('csv');
+            return;
+        }
+        
         // Get visible anomalies
         const anomalies = [];
         document.querySelectorAll('.anomaly-item').forEach(item => {
@@ -290,6 +304,52 @@ document.addEventListener('DOMContentLoaded', function() {
         showAlert('successAlert', `Exported ${anomalies.length} anomalies to CSV.`);
     }
     
+    function getCheckedValues(checkboxes) {
+        return checkboxes.filter(([id]) => {
+            const checkbox = document.getElementById(id);
+            return checkbox && checkbox.checked;
+        }).map(([, value]) => value).join(',');
+    }
+    
+    function exportAnomaliesFromServer(format) {
+        // Send the same filters the anomaly list applies
+        const params = new URLSearchParams({ format: format });
+        params.set('confidence', getCheckedValues([
+            ['highConfidence', 'high'], ['mediumConfidence', 'medium'], ['lowConfidence', 'low']
+        ]));
+        params.set('review_type', getCheckedValues([
+            ['desktopReview', 'desktop'], ['fieldReview', 'field']
+        ]));
+        
+        const searchInput = document.getElementById('searchAnomalies');
+        if (searchInput && searchInput.value) {
+            params.set('search', searchInput.value);
+        }
+        
+        const minPCI = document.getElementById('min-pci');
+        const maxPCI = document.getElementById('max-pci');
+        if (minPCI && minPCI.value !== '') {
+            params.set('min_pci', minPCI.value);
+        }
+        if (maxPCI && maxPCI.value !== '') {
+            params.set('max_pci', maxPCI.value);
+        }
+        
+        const manualRanges = Array.from(document.querySelectorAll('.manual-range-filter:checked')).map(filter => filter.value);
+        if (manualRanges.length > 0) {
+            params.set('pci_ranges', manualRanges.join(','));
+        }
+        
+        // Navigating to the download lets the browser stream it to disk instead of holding it in memory
+        const link = document.createElement('a');
+        link.setAttribute('href', `/api/sessions/${sessionId}/anomalies?${params.toString()}`);
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
+        
+        showAlert('successAlert', `Exporting anomalies as ${format.toUpperCase()}...`);
+    }
+    
     // ===== Manual PCI Range Input =====
     const manualRangeInput = document.getElementById('manualRanges');
     if (manualRangeInput) {
@@ -367,6 +427,8 @@ document.addEventListener('DOMContentLoaded', function() {
         showLoading,
         hideLoading,
         switchToAnalysisTab,
-        updateChartIfAvailable
+        updateChartIfAvailable,
+        getSessionId: () => sessionId,
+        exportAnomaliesFromServer
     };
 });
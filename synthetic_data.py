@@ -0,0 +1,230 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Road categories with their share of the network, typical traffic and annual PCI loss
+ROAD_CATEGORIES = {
+    'Arterial': {'share': 0.3, 'traffic': 13000, 'decay': 3.5},
+    'Collector': {'share': 0.3, 'traffic': 8000, 'decay': 3.0},
+    'Local': {'share': 0.4, 'traffic': 4500, 'decay': 2.5}
+}
+
+# Maintenance treatments: share of treated sections, PCI effect, cost, contractor and warranty (months)
+MAINTENANCE_TYPES = {
+    'Crack Sealing': {'share': 0.35, 'major': False, 'cost': 13000, 'contractor': 'RoadFix Inc.', 'warranty': 12},
+    'Patching': {'share': 0.35, 'major': False, 'cost': 17000, 'contractor': 'PaveMasters', 'warranty': 24},
+    'Mill and Fill': {'share': 0.15, 'major': True, 'cost': 95000, 'contractor': 'AsphaltPro', 'warranty': 36},
+    'Overlay': {'share': 0.1, 'major': True, 'cost': 120000, 'contractor': 'AsphaltPro', 'warranty': 48},
+    'Reconstruction': {'share': 0.05, 'major': True, 'cost': 250000, 'contractor': 'UrbanRoads LLC', 'warranty': 60}
+}
+
+# Injected anomaly types and the detector expected to recover them
+ANOMALY_TYPES = {
+    'pci_outlier': 'pci_outliers',
+    'excessive_deterioration': 'deterioration',
+    'unexplained_improvement': 'deterioration',
+    'poor_after_major_treatment': 'maintenance_inconsistencies',
+    'context_mismatch': 'multivariate'
+}
+
+HISTORICAL_SURVEY_START = pd.Timestamp('2020-06-01')
+CURRENT_SURVEY_START = pd.Timestamp('2023-05-01')
+SURVEY_WINDOW_DAYS = 60
+
+def generate_network(n_sections, anomaly_rate=0.01, maintenance_rate=0.3, seed=0, start_id=1001):
+    """
+    Generate a synthetic pavement network with the same schemas as the bundled sample CSVs
+
+    PCI decays from the historical survey at a rate driven by road category and traffic,
+    treated sections are reset by major maintenance or nudged up by minor maintenance,
+    and deflection, IRI, rutting and surface condition follow PCI. A fraction of sections
+    then has one known anomaly injected per type in ANOMALY_TYPES.
+
+    Parameters:
+    n_sections (int): Number of road sections
+    anomaly_rate (float): Fraction of sections injected with each anomaly type
+    maintenance_rate (float): Fraction of sections treated between the two surveys
+    seed (int): Random seed
+    start_id (int): First section ID
+
+    Returns:
+    dict: DataFrames keyed by 'current', 'historical', 'maintenance' and 'injected'
+          (section_id, anomaly_type, expected_detector)
+    """
+    rng = np.random.default_rng(seed)
+    section_ids = np.arange(start_id, start_id + n_sections)
+
+    categories = list(ROAD_CATEGORIES)
+    category_idx = rng.choice(len(categories), size=n_sections, p=[ROAD_CATEGORIES[c]['share'] for c in categories])
+    road_category = np.array(categories)[category_idx]
+    base_traffic = np.array([ROAD_CATEGORIES[c]['traffic'] for c in categories])[category_idx]
+    base_decay = np.array([ROAD_CATEGORIES[c]['decay'] for c in categories])[category_idx]
+
+    traffic_volume = np.round(base_traffic * rng.lognormal(0, 0.25, n_sections), -2)
+    latitude = np.round(37.7749 + rng.uniform(0, 0.2, n_sections), 4)
+    longitude = np.round(-122.4194 + rng.uniform(0, 0.2, n_sections), 4)
+
+    historical_date = HISTORICAL_SURVEY_START + pd.to_timedelta(rng.integers(0, SURVEY_WINDOW_DAYS, n_sections), unit='D')
+    current_date = CURRENT_SURVEY_START + pd.to_timedelta(rng.integers(0, SURVEY_WINDOW_DAYS, n_sections), unit='D')
+    years_between = (current_date - historical_date).days.to_numpy() / 365.25
+
+    historical_pci = np.clip(rng.normal(80, 10, n_sections), 40, 100)
+
+    # Heavier traffic wears pavement faster
+    decay_rate = np.clip(base_decay * (traffic_volume / base_traffic) ** 0.5 + rng.normal(0, 0.7, n_sections), 0.5, 8)
+    current_pci = historical_pci - decay_rate * years_between
+
+    # Maintenance between surveys: major treatments reset PCI, minor ones add a few points
+    treatment_names = list(MAINTENANCE_TYPES)
+    treated = rng.random(n_sections) < maintenance_rate
+    treatment_idx = rng.choice(
+        len(treatment_names), size=n_sections, p=[MAINTENANCE_TYPES[t]['share'] for t in treatment_names]
+    )
+    is_major = np.array([MAINTENANCE_TYPES[t]['major'] for t in treatment_names])[treatment_idx]
+    days_between = (current_date - historical_date).days.to_numpy()
+    maintenance_offset = rng.integers(30, np.maximum(days_between - 30, 31))
+    maintenance_date = (historical_date + pd.to_timedelta(maintenance_offset, unit='D')).to_numpy().copy()
+    years_since_maintenance = (current_date.to_numpy() - maintenance_date) / np.timedelta64(1, 'D') / 365.25
+
+    major_reset = treated & is_major
+    current_pci[major_reset] = (
+        rng.uniform(96, 100, major_reset.sum()) - 1.5 * years_since_maintenance[major_reset]
+    )
+    minor_bump = treated & ~is_major
+    current_pci[minor_bump] += rng.uniform(0, 4, minor_bump.sum())
+
+    # Inject anomalies at known rates on untouched, non-overlapping sections
+    injected = []
+    injected_idx = {}
+    available = rng.permutation(n_sections)
+    n_per_type = int(round(n_sections * anomaly_rate))
+    position = 0
+    for anomaly_type, detector in ANOMALY_TYPES.items():
+        idx = available[position:position + n_per_type]
+        position += n_per_type
+        injected_idx[anomaly_type] = idx
+        injected.append(pd.DataFrame({
+            'section_id': section_ids[idx],
+            'anomaly_type': anomaly_type,
+            'expected_detector': detector
+        }))
+
+        if anomaly_type == 'pci_outlier':
+            treated[idx] = False
+            current_pci[idx] = rng.uniform(0, 5, len(idx))
+        elif anomaly_type == 'excessive_deterioration':
+            treated[idx] = False
+            historical_pci[idx] = rng.uniform(90, 100, len(idx))
+            current_pci[idx] = historical_pci[idx] - rng.uniform(18, 25, len(idx)) * years_between[idx]
+        elif anomaly_type == 'unexplained_improvement':
+            treated[idx] = False
+            historical_pci[idx] = rng.uniform(50, 65, len(idx))
+            current_pci[idx] = historical_pci[idx] + rng.uniform(8, 12, len(idx)) * years_between[idx]
+        elif anomaly_type == 'poor_after_major_treatment':
+            treated[idx] = True
+            treatment_idx[idx] = treatment_names.index('Reconstruction')
+            maintenance_date[idx] = (current_date[idx] - pd.to_timedelta(rng.integers(90, 600, len(idx)), unit='D')).to_numpy()
+            current_pci[idx] = rng.uniform(45, 70, len(idx))
+
+    current_pci = np.clip(current_pci, 0, 100)
+
+    # Structural response follows condition; context_mismatch breaks that link afterwards
+    deflection = 0.2 + (100 - current_pci) * 0.0065 + rng.normal(0, 0.02, n_sections)
+    historical_deflection = 0.2 + (100 - historical_pci) * 0.0065 + rng.normal(0, 0.02, n_sections)
+    mismatch_idx = injected_idx['context_mismatch']
+    deflection[mismatch_idx] += rng.uniform(0.35, 0.5, len(mismatch_idx))
+
+    current = pd.DataFrame({
+        'section_id': section_ids,
+        'measurement_date': current_date.strftime('%Y-%m-%d'),
+        'temperature': np.round(rng.normal(85, 1, n_sections), 1),
+        'deflection': np.round(deflection, 2),
+        'surface_condition': get_surface_condition(current_pci),
+        'traffic_volume': traffic_volume.astype(int),
+        'pci': np.round(current_pci).astype(int),
+        'road_category': road_category,
+        'latitude': latitude,
+        'longitude': longitude
+    })
+
+    historical = pd.DataFrame({
+        'section_id': section_ids,
+        'measurement_date': historical_date.strftime('%Y-%m-%d'),
+        'temperature': np.round(rng.normal(83.3, 0.6, n_sections), 1),
+        'deflection': np.round(historical_deflection, 2),
+        'surface_condition': get_surface_condition(historical_pci),
+        'iri_value': np.round(1 + (100 - historical_pci) * 0.08 + rng.normal(0, 0.1, n_sections), 1),
+        'rutting': np.round(0.1 + (100 - historical_pci) * 0.011 + rng.normal(0, 0.01, n_sections), 2),
+        'pci': np.round(historical_pci).astype(int),
+        'road_category': road_category,
+        'latitude': latitude,
+        'longitude': longitude
+    })
+
+    treated_idx = np.flatnonzero(treated)
+    treatment = np.array(treatment_names)[treatment_idx[treated_idx]]
+    maintenance = pd.DataFrame({
+        'section_id': section_ids[treated_idx],
+        'maintenance_date': pd.DatetimeIndex(maintenance_date[treated_idx]).strftime('%Y-%m-%d'),
+        'maintenance_type': treatment,
+        'cost': np.round(
+            np.array([MAINTENANCE_TYPES[t]['cost'] for t in treatment_names])[treatment_idx[treated_idx]]
+            * rng.uniform(0.8, 1.2, len(treated_idx)), -2
+        ).astype(int),
+        'contractor': np.array([MAINTENANCE_TYPES[t]['contractor'] for t in treatment_names])[treatment_idx[treated_idx]],
+        'warranty_period': np.array([MAINTENANCE_TYPES[t]['warranty'] for t in treatment_names])[treatment_idx[treated_idx]],
+        'latitude': latitude[treated_idx],
+        'longitude': longitude[treated_idx]
+    })
+
+    return {
+        'current': current,
+        'historical': historical,
+        'maintenance': maintenance,
+        'injected': pd.concat(injected, ignore_index=True)
+    }
+
+def get_surface_condition(pci):
+    """
+    Map PCI values to the surface condition labels used in the sample data
+
+    Parameters:
+    pci (numpy.ndarray): PCI values
+
+    Returns:
+    numpy.ndarray: Surface condition labels
+    """
+    return np.select(
+        [pci < 30, pci < 55, pci < 75],
+        ['Very Poor', 'Poor', 'Fair'],
+        default='Good'
+    )
+
+def write_network(network, output_dir, prefix=''):
+    """
+    Write a generated network to CSV files named like the upload folder files
+
+    Parameters:
+    network (dict): Network returned by generate_network
+    output_dir (str): Directory to write to
+    prefix (str): Optional prefix added after the data type, e.g. 'bench_'
+
+    Returns:
+    dict: File paths keyed by 'current', 'historical', 'maintenance' and 'injected'
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    file_names = {
+        'current': f'current_{prefix}pmp_data.csv',
+        'historical': f'historical_{prefix}pmp_data.csv',
+        'maintenance': f'maintenance_{prefix}history_data.csv',
+        'injected': f'injected_{prefix}anomalies.csv'
+    }
+
+    paths = {}
+    for key, file_name in file_names.items():
+        paths[key] = os.path.join(output_dir, file_name)
+        network[key].to_csv(paths[key], index=False)
+
+    return paths